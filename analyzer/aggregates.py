@@ -0,0 +1,259 @@
+""" Population averages of the per-game metrics, kept as mergeable running aggregates instead of rescanning games. """
+import json
+import math
+import os
+import threading
+import time
+
+import numpy as np
+
+import features
+import util
+
+logger = util.Logger(__name__)
+
+# features with a running mean and variance, one value per game row, the participants of games with a team row
+METRICS = (
+    "kp", "fw_kills", "positioning", "ganking", "kda", "gold_share", "cs_share",
+    "gold_diff.overall", "gold_diff.early", "gold_diff.mid", "gold_diff.late",
+    "cs_diff.overall", "cs_diff.early", "cs_diff.mid", "cs_diff.late",
+)
+# plain sums over all game rows
+COUNTS = ("games", "wins", "kills", "deaths", "assists", "minions")
+# classes of `enums` holding the distribution of a metric
+CONSTANTS = {
+    "KP": "kp",
+    "FWK": "fw_kills",
+    "POS": "positioning",
+    "Ganking": "ganking",
+    "KDA": "kda",
+    "GoldShare": "gold_share",
+    "GoldDiffAll": "gold_diff.overall",
+    "CreepShare": "cs_share",
+    "CSD": "cs_diff.overall",
+}
+
+
+class AggregatesUnavailable(LookupError):
+    pass
+
+
+class RunningStats:
+    """
+    Count, mean and sum of squared deviations of a metric, updated with Welford's method.
+
+    Two instances over disjoint games merge into the statistics of all of their games, so batches can be added in
+    any order without keeping the values. NaN values are not counted.
+    """
+
+    def __init__(self, count=0, mean=0.0, m2=0.0):
+        self.count = count
+        self.mean = mean
+        self.m2 = m2
+
+    def add(self, values):
+        values = np.ravel(np.asarray(values, dtype=float))
+        values = values[~np.isnan(values)]
+        if len(values) == 0:
+            return
+        mean = float(np.mean(values))
+        self.merge(RunningStats(len(values), mean, float(np.sum((values - mean) ** 2))))
+
+    def merge(self, other):
+        count = self.count + other.count
+        if count == 0:
+            return
+        delta = other.mean - self.mean
+        self.mean += delta * other.count / count
+        self.m2 += other.m2 + delta ** 2 * self.count * other.count / count
+        self.count = count
+
+    @property
+    def variance(self):
+        """ Population variance, NaN without values. """
+        return self.m2 / self.count if self.count > 0 else math.nan
+
+    def average(self):
+        """ Mean, NaN without values. """
+        return self.mean if self.count > 0 else math.nan
+
+    def to_dict(self):
+        return {"count": self.count, "mean": self.mean, "m2": self.m2}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data["count"], data["mean"], data["m2"])
+
+
+class Aggregates:
+    """
+    Running aggregates of all metrics plus the last chunk of the feature store they contain.
+
+    Feature chunks are append-only and numbered in the order they were stored, so the number of the last aggregated
+    chunk is all that is needed to find the games that are not part of the aggregates yet. Aggregates of another
+    feature version are not continued, since the store recomputes all games into new chunks.
+    """
+
+    def __init__(self, stats=None, counts=None, last_chunk=-1, version=features.VERSION, updated_at=None):
+        self.stats = stats if stats is not None else {metric: RunningStats() for metric in METRICS}
+        self.counts = counts if counts is not None else {count: 0 for count in COUNTS}
+        self.last_chunk = last_chunk
+        self.version = version
+        self.updated_at = updated_at
+
+    def add(self, chunk, metrics: dict, counts: dict):
+        """
+        Add the game rows of a feature chunk stored after the last aggregated one.
+
+        :param chunk: number of the feature chunk
+        :param metrics: values of every metric, one per game row
+        :param counts: sum of every count over the game rows
+        """
+        for metric, values in metrics.items():
+            self.stats[metric].add(values)
+        for count, value in counts.items():
+            self.counts[count] += value
+        self.last_chunk = max(self.last_chunk, chunk)
+
+    def merge(self, other):
+        """ Add the aggregates of disjoint game rows. """
+        for metric, stats in other.stats.items():
+            self.stats[metric].merge(stats)
+        for count, value in other.counts.items():
+            self.counts[count] += value
+        self.last_chunk = max(self.last_chunk, other.last_chunk)
+
+    def mean(self, metric):
+        return self.stats[metric].average()
+
+    def constants(self):
+        """ `MU`/`VAR` of the distribution classes in `enums`, regenerated from the aggregates. """
+        return {
+            name: {"MU": self.stats[metric].average(), "VAR": self.stats[metric].variance}
+            for name, metric in CONSTANTS.items()
+        }
+
+    def to_json(self):
+        return json.dumps({
+            "stats": {metric: stats.to_dict() for metric, stats in self.stats.items()},
+            "counts": self.counts,
+            "last_chunk": self.last_chunk,
+            "version": self.version,
+            "updated_at": self.updated_at,
+        })
+
+    @classmethod
+    def from_json(cls, data):
+        data = json.loads(data)
+        stats = {metric: RunningStats() for metric in METRICS}
+        stats.update({metric: RunningStats.from_dict(values) for metric, values in data["stats"].items()})
+        counts = {count: 0 for count in COUNTS}
+        counts.update(data["counts"])
+        return cls(stats, counts, data.get("last_chunk", -1), data.get("version"), data["updated_at"])
+
+
+class AggregateStore:
+    """
+    Aggregates shared by all requests of a worker, stored in one JSON file.
+
+    Like the model registry, the file is replaced atomically when the aggregates are updated and reloaded by the
+    other workers when it changes, checked at most every `check_interval` seconds.
+    """
+
+    def __init__(self, path, check_interval: float):
+        self.path = path
+        self.check_interval = check_interval
+        self._aggregates = None
+        self._signature = None
+        self._checked_at = 0
+        self._lock = threading.Lock()
+
+    def get(self) -> Aggregates:
+        """ Current aggregates, reloaded first if the file changed. Do not modify them. """
+        now = time.monotonic()
+        if self._aggregates is not None and now - self._checked_at < self.check_interval:
+            return self._aggregates
+
+        with self._lock:
+            self._checked_at = now
+            try:
+                signature = self._stat()
+            except FileNotFoundError:
+                if self._aggregates is not None:
+                    return self._aggregates
+                raise AggregatesUnavailable(self.path)
+            if self._aggregates is None or self._signature != signature:
+                with open(self.path) as file:
+                    self._aggregates = Aggregates.from_json(file.read())
+                self._signature = signature
+            return self._aggregates
+
+    def publish(self, aggregates: Aggregates):
+        """ Store updated aggregates atomically and serve them right away. """
+        aggregates.updated_at = time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime())
+        data = aggregates.to_json()
+        tmp_path = f'{self.path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(tmp_path, 'w') as file:
+            file.write(data)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(tmp_path, self.path)
+
+        with self._lock:
+            self._aggregates = aggregates
+            self._signature = self._stat()
+            self._checked_at = time.monotonic()
+        logger.info(f'published aggregates of {aggregates.counts["games"]} games')
+
+    def update(self, conn, job, checkpoint: int = 500):
+        """
+        Add all feature chunks stored after the last aggregated one. Runs as a background job.
+
+        The features of new games are computed first. Chunks are then read back one at a time, including chunks
+        stored by other jobs such as model retraining, so the aggregates keep a constant size and no game is counted
+        before its features exist. The aggregates are published every `checkpoint` new game rows, so an interrupted
+        update keeps its progress.
+        """
+        try:
+            aggregates = Aggregates.from_json(self.get().to_json())
+        except AggregatesUnavailable:
+            aggregates = Aggregates()
+        if aggregates.version != features.VERSION:
+            logger.warn(f'recomputing aggregates of feature version {aggregates.version}')
+            aggregates = Aggregates()
+
+        features.store.update(conn, job)
+        added = 0
+        pending = 0
+        for chunk, table in features.store.chunks(after=aggregates.last_chunk):
+            # game rows are the participants of games with a team row
+            rows = ~np.isnan(table.columns["win"])
+            metrics = {metric: table.columns[metric][rows] for metric in METRICS}
+            # the creep score differences only count for games with a known team creep score
+            for phase in features.PHASES:
+                metrics[f"cs_diff.{phase}"][np.isnan(metrics["cs_share"])] = np.nan
+            counts = {
+                "games": int(np.count_nonzero(rows)),
+                "wins": int(np.nansum(table.columns["win"][rows])),
+            }
+            counts.update({count: int(np.nansum(table.columns[count][rows]))
+                           for count in ("kills", "deaths", "assists", "minions")})
+            aggregates.add(chunk, metrics, counts)
+            added += counts["games"]
+            pending += counts["games"]
+            if pending >= checkpoint:
+                self.publish(aggregates)
+                pending = 0
+
+        self.publish(aggregates)
+        return {"games": aggregates.counts["games"], "added": added}
+
+    def _stat(self):
+        stat = os.stat(self.path)
+        return stat.st_mtime_ns, stat.st_size
+
+
+store = AggregateStore(
+    path=os.getenv('AGGREGATES_PATH', '/analyzer/aggregates.json'),
+    check_interval=float(os.getenv('AGGREGATES_CHECK_INTERVAL', 5)),
+)
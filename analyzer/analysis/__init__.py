@@ -1 +1 @@
-from analysis import base_analysis, combinations, aggression, classification
+from analysis import normalization, positions, frames, regions, kills, base_analysis, combinations, aggression, classification, fights
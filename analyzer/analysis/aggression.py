@@ -1,11 +1,9 @@
-import ast
-import math
-
 import numpy as np
-import scipy.stats as stats
-from scipy.integrate import quad
 
-from enums import GameState, Constants, Role, Map, KP, FightType, FWK, POS, Ganking
+from analysis import normalization, regions
+from analysis.frames import GameFrames
+from analysis.kills import KillTable
+from enums import Constants, Map, FightType, FWK, POS, Ganking
 import util
 
 logger = util.Logger(__name__)
@@ -14,151 +12,130 @@ EPSILON = 1000
 
 
 def aggression(kp, fw_kills, pos, ganking):
-    kp_val = stats.norm.cdf(kp, KP.MU, KP.SIG)
-    fwk_val = stats.expon.cdf(fw_kills, scale=FWK.MU)
-    pos_val = stats.norm.cdf(pos, POS.MU, POS.SIG)
-    gank_val = stats.expon.cdf(ganking, scale=Ganking.MU)
+    kp_val = normalization.KP.cdf(kp)
+    fwk_val = normalization.FWK.cdf(fw_kills)
+    pos_val = normalization.POS.cdf(pos)
+    gank_val = normalization.GANKING.cdf(ganking)
 
     aggro = (kp_val + fwk_val + pos_val + gank_val) / 4
     return util.normalize(aggro, -2, 2)
 
 
-def positioning(team_id, frames):
-    aggressive = []
-    passive = []
-
-    for frame in frames:
-        if frame["position"] is None:
-            break
-        position = ast.literal_eval(frame["position"])
-        distance = _distance(position[0], position[1], Map.HEIGHT / Map.WIDTH, c=-Map.HEIGHT)
-
-        if team_id == 100:
-            if distance > 0 + Constants.DIST_EPS:
-                aggressive.append(distance / Map.HALF_DIST)
-                passive.append(0)
-            elif distance < 0 - Constants.DIST_EPS:
-                passive.append(abs(distance) / Map.HALF_DIST)
-                aggressive.append(0)
-        else:
-            if distance < 0 - Constants.DIST_EPS:
-                aggressive.append(abs(distance) / Map.HALF_DIST)
-                passive.append(0)
-            elif distance > 0 + Constants.DIST_EPS:
-                passive.append(distance / Map.HALF_DIST)
-                aggressive.append(0)
-
-    return (np.average(np.array(aggressive)) + (1 - np.average(np.array(passive)))) / 2
-
-
-def ss_positioning(team_id, frames):
-    pos = positioning(team_id, frames)
+def positioning(team_id, frames: GameFrames, participant):
+    if participant not in frames:
+        return np.nan
+    x = frames.column("x", participant)
+    y = frames.column("y", participant)
+    # only frames up to the first one without a position count
+    missing = np.flatnonzero(np.isnan(x))
+    if len(missing) > 0:
+        x = x[:missing[0]]
+        y = y[:missing[0]]
+
+    distance = regions.diagonal_distance(x, y)
+    # distance towards the enemy base is positive for both teams
+    if team_id != 100:
+        distance = -distance
+
+    outside_eps = (distance > 0 + Constants.DIST_EPS) | (distance < 0 - Constants.DIST_EPS)
+    aggressive = np.where(distance > 0, distance / Map.HALF_DIST, 0)[outside_eps]
+    passive = np.where(distance < 0, -distance / Map.HALF_DIST, 0)[outside_eps]
+
+    if len(aggressive) == 0:
+        return np.nan
+    return (np.average(aggressive) + (1 - np.average(passive))) / 2
+
+
+def ss_positioning(team_id, frames: GameFrames, participant):
+    pos = positioning(team_id, frames, participant)
     return (pos - POS.MU) / POS.SIG
 
 
-def ganking(participant, role, frames, kills):
-    overall = 0
-    ganks = 0
-    for kill in kills:
-        if kill["killer"] == participant or kill["victim"] == participant \
-                or participant in kill["assistingparticipantids"]:
-            kill_position = ast.literal_eval(kill["position"])
-            kill_time = kill["timestamp"] / Constants.TIME
-
-            affected_frames = frames[10 * round(kill_time):10 * round(kill_time) + 9]
-            overall += 1
-            if _detect_fight_type(kill_time, kill_position, affected_frames) == FightType.GANK:
-                if role == Role.TOP:
-                    gradient = 6712 / 6431
-                    b = -1
-                    c = 5120.93
-                    d = 1
-                elif role == Role.MID:
-                    gradient = Map.CENTER[1] / Map.CENTER[0]
-                    b = -1
-                    c = 0
-                    d= 0
-                elif role == Role.BOT or role == Role.SUP:
-                    gradient = 6743 / 6408
-                    b = -1
-                    c = -5797.71
-                    d = -1
-                else:
-                    # either JGL or unknown role (default: increase)
-                    ganks += 1
-                    break
-                dist = _distance(kill_position[0], kill_position[1], gradient=gradient, b=b, c=c)
-
-                if role == Role.MID:
-                    if abs(dist) >= 1000:
-                        ganks += 1
-                else:
-                    if dist * d >= 1000:
-                        ganks += 1
-
-    try:
-        return ganks / overall
-    except ZeroDivisionError:
+def ganking(participant, role, kills, people):
+    """
+    Share of the kills a participant was involved in which were ganks.
+
+    :param participant: participant id
+    :param role: canonic lane of the participant
+    :param kills: decoded kills of the game
+    :param people: participants within the fight radius of every kill, see `fight_sizes`
+    :return: share of ganks, 0 if the participant was not involved in any kill with a position
+    """
+    involved = np.array([
+        kill["position"] is not None and (kill["killer"] == participant or kill["victim"] == participant
+                                          or participant in kill["assistingparticipantids"])
+        for kill in kills
+    ], dtype=bool)
+    overall = np.count_nonzero(involved)
+    if overall == 0:
         return 0
 
+    ganks = involved & (fight_types(people) == FightType.GANK)
+    if role in regions.LANES:
+        # only ganks away from the participant's own lane count
+        positions = _kill_positions(kills)[ganks]
+        lane = regions.raster.regions(positions[:, 0], positions[:, 1])
+        return np.count_nonzero(lane != regions.LANES[role]) / overall
+    # either JGL or unknown role, every gank counts
+    return np.count_nonzero(ganks) / overall
 
-def ss_ganking(participant, role, frames, kills):
-    gank = ganking(participant, role, frames, kills)
+
+def ss_ganking(participant, role, kills, people):
+    gank = ganking(participant, role, kills, people)
     return (gank - Ganking.MU) / Ganking.SIG
 
 
-def _detect_fight_type(kill_time, kill_position, time_frames):
-    people = 0
+def fight_sizes(frames: GameFrames, kills):
+    """
+    Number of participants within the fight radius of every kill of a game.
+
+    The positions of the frame closest to a kill are compared against the kill position for all kills and
+    participants at once. The radius grows with the time between the kill and that frame.
 
-    time_diff = abs((round(kill_time) - kill_time))
-    radius = Constants.FIGHT_RADIUS + Constants.FIGHT_RADIUS * time_diff
-    for time_frame in time_frames:
-        if time_frame["timestamp"] % (round(kill_time) * 60000) < 60000:
-            if time_frame["position"] is None:
-                break
-            position = ast.literal_eval(time_frame["position"])
-            circle_dist = pow(position[0] - kill_position[0], 2) + pow(position[1] - kill_position[1], 2)
-            if circle_dist < pow(radius, 2):
-                people += 1
+    :param frames: columnar frames of all participants of the game
+    :param kills: decoded kills of the game
+    :return: people per kill, 0 for kills without a position
+    """
+    if len(kills) == 0 or frames.x.shape[0] == 0:
+        return np.zeros(len(kills), dtype=np.int64)
+    kill_time = np.array([kill["timestamp"] for kill in kills], dtype=float) / Constants.TIME
+    positions = _kill_positions(kills)
 
-    if people <= 3:
-        return FightType.SOLO
-    if 3 < people < 7:
-        return FightType.GANK
-    if people >= 7:
-        return FightType.TEAM_FIGHT
-    else:
-        return None
+    minute = np.round(kill_time).astype(np.int64)
+    radius = Constants.FIGHT_RADIUS + Constants.FIGHT_RADIUS * np.abs(minute - kill_time)
+    # positions of all participants in the frame of each kill, NaN for kills after the last frame
+    recorded = minute < frames.x.shape[0]
+    rows = np.where(recorded, minute, 0)
+    x = np.where(recorded[:, np.newaxis], frames.x[rows], np.nan)
+    y = np.where(recorded[:, np.newaxis], frames.y[rows], np.nan)
+
+    circle_dist = (x - positions[:, 0, np.newaxis]) ** 2 + (y - positions[:, 1, np.newaxis]) ** 2
+    return np.count_nonzero(circle_dist < radius[:, np.newaxis] ** 2, axis=1)
+
+
+def fight_types(people):
+    """ FightType of every kill from the number of participants in its fight. """
+    people = np.asarray(people)
+    return np.select([people <= 3, people < 7], [FightType.SOLO, FightType.GANK], FightType.TEAM_FIGHT)
+
+
+def _kill_positions(kills):
+    """ Kill positions as (n, 2) array, NaN for kills without a position. """
+    positions = np.full((len(kills), 2), np.nan)
+    for idx, kill in enumerate(kills):
+        if kill["position"] is not None:
+            positions[idx] = kill["position"]
+    return positions
 
 
 def forward_kills(participant, kills):
-    overall_kills = 0
-    fw_kills = 0
-
-    for kill in kills:
-        if kill["killer"] == participant or participant in kill["assistingparticipantids"]:
-            position = ast.literal_eval(kill["position"])
-            distance = _distance(position[0], position[1], Map.HEIGHT / Map.WIDTH, c=-Map.HEIGHT)
-
-            if kill["teamid"] == 100:
-                if distance > 0 + Constants.DIST_EPS:
-                    fw_kills += 1
-            else:
-                if distance < 0 - Constants.DIST_EPS:
-                    fw_kills += 1
-        overall_kills += 1
-
-    try:
-        return fw_kills / overall_kills
-    except ZeroDivisionError:
-        return 0
+    """
+    Share of the team's kills a participant took part in on the enemy half of the map. Kills must be decoded.
+    Use a KillTable to look up many participants.
+    """
+    return KillTable.build(kills).forward_kills(participant)
 
 
 def ss_forward_kills(participant, kills):
     fw_kill = forward_kills(participant, kills)
     return (fw_kill - FWK.MU) / FWK.SIG
-
-
-def _distance(x, y, gradient, b=1, c=1):
-    norm = math.sqrt(pow(gradient, 2) + pow(b, 2))
-    return (gradient * x + b * y + c) / norm
@@ -6,22 +6,15 @@ import numpy as np
 import database
 import model
 from analyzer import util
+from analysis import frames as frame_store
+from analysis.kills import KillTable
+from analysis.frames import GameFrames
 from enums import Role, GameState, KP
 
 
 def kill_participation(participant: str, kills):
-    overall_kills = 0
-    summoner_kp = 0
-
-    for kill in kills:
-        if kill["killer"] == participant or participant in kill["assistingparticipantids"]:
-            summoner_kp += 1
-        overall_kills += 1
-
-    try:
-        return summoner_kp / overall_kills
-    except ZeroDivisionError:
-        return 0
+    """ Share of the given kills a participant killed or assisted. Use a KillTable to look up many participants. """
+    return KillTable.build(kills).kill_participation(participant)
 
 
 def game_kda(stat):
@@ -76,29 +69,83 @@ def determine_avg_role(games, role_key, lane_key):
     return role_keys[int(avg_role) - 1]
 
 
-def gold_diff(frames, opponent_frames):
-    diff = {
-        "overall": [],
-        "early": [],
-        "mid": [],
-        "late": []
+def phase_averages(diffs):
+    """
+    Average per-minute differences of many games, overall and per game state.
+
+    :param diffs: differences indexed [game, minute], NaN where a minute is missing
+    :return: dictionary of overall, early, mid and late averages, one value per game (NaN if there is none)
+    """
+    minutes = np.arange(diffs.shape[1])
+    valid = ~np.isnan(diffs)
+    values = np.where(valid, diffs, 0)
+    masks = {
+        "overall": np.ones(len(minutes), dtype=bool),
+        "early": minutes <= GameState.EARLY[1],
+        "mid": (GameState.MID[0] <= minutes) & (minutes <= GameState.MID[1]),
+        "late": (GameState.LATE[0] <= minutes) & (minutes <= GameState.LATE[1]),
     }
-    for idx, frame in enumerate(frames):
-        gd = frame["totalgold"] - opponent_frames[idx]["totalgold"]
-        if idx <= GameState.EARLY[1]:
-            diff["early"].append(gd)
-        elif GameState.MID[0] <= idx <= GameState.MID[1]:
-            diff["mid"].append(gd)
-        elif GameState.LATE[0] <= idx <= GameState.LATE[1]:
-            diff["late"].append(gd)
-        diff["overall"].append(gd)
 
-    diff["overall"] = np.average(np.array(diff["overall"]))
-    diff["early"] = np.average(np.array(diff["early"]))
-    diff["mid"] = np.average(np.array(diff["mid"]))
-    diff["late"] = np.average(np.array(diff["late"]))
+    averages = {}
+    for phase, mask in masks.items():
+        counts = np.count_nonzero(valid & mask, axis=1)
+        sums = np.sum(values * mask, axis=1)
+        with np.errstate(invalid='ignore'):
+            averages[phase] = sums / counts
+    return averages
+
+
+def lane_diffs(players, opponents):
+    """
+    Average difference of per-minute values of players to their lane opponents for many games at once.
+
+    Only the minutes the player has frames for count; minutes the opponent has no frame for are left out.
+
+    :param players: per-minute values of the player, one column per game
+    :param opponents: per-minute values of the lane opponent, one column per game
+    :return: dictionary of overall, early, mid and late differences, one value per game
+    """
+    player = frame_store.stack(players)
+    opponent = frame_store.stack([o[:len(p)] for p, o in zip(players, opponents)], width=player.shape[1])
+    return phase_averages(player - opponent)
+
 
-    return diff
+def gold_diffs(lanes):
+    """
+    Gold differences for many games in one pass.
+
+    :param lanes: (frames, participant, opponent) per game
+    :return: dictionary of overall, early, mid and late gold difference arrays, one value per game
+    """
+    return lane_diffs(
+        [frames.column("totalgold", participant) for frames, participant, _ in lanes],
+        [frames.column("totalgold", opponent) for frames, _, opponent in lanes],
+    )
+
+
+def cs_diffs(lanes):
+    """
+    Creep score differences for many games in one pass.
+
+    :param lanes: (frames, participant, opponent) per game
+    :return: dictionary of overall, early, mid and late creep score difference arrays, one value per game
+    """
+    return lane_diffs(
+        [frames.cs(participant) for frames, participant, _ in lanes],
+        [frames.cs(opponent) for frames, _, opponent in lanes],
+    )
+
+
+def gold_diff(frames: GameFrames, participant, opponent):
+    """
+    Average gold difference of a participant to its lane opponent, overall and per game state.
+
+    :param frames: frames of the game containing both participants
+    :param participant: participant id
+    :param opponent: participant id of the lane opponent
+    :return: dictionary of overall, early, mid and late gold difference
+    """
+    return {phase: diffs[0] for phase, diffs in gold_diffs([(frames, participant, opponent)]).items()}
 
 
 def gold_share(p_gold, team_gold):
@@ -109,37 +156,22 @@ def cs_share(p_cs, team_cs):
     return p_cs / team_cs
 
 
-def cs_diff(frames, opponent_frames):
-    diff = {
-        "overall": [],
-        "early": [],
-        "mid": [],
-        "late": []
-    }
-    for idx, frame in enumerate(frames):
-        p_cs = frame["minionskilled"] + frame["jungleminionskilled"]
-        o_cs = opponent_frames[idx]["minionskilled"] + opponent_frames[idx]["jungleminionskilled"]
-        csd = p_cs - o_cs
-        if idx <= GameState.EARLY[1]:
-            diff["early"].append(csd)
-        elif GameState.MID[0] <= idx <= GameState.MID[1]:
-            diff["mid"].append(csd)
-        elif GameState.LATE[0] <= idx <= GameState.LATE[1]:
-            diff["late"].append(csd)
-        diff["overall"].append(csd)
-
-    diff["overall"] = np.average(np.array(diff["overall"]))
-    diff["early"] = np.average(np.array(diff["early"]))
-    diff["mid"] = np.average(np.array(diff["mid"]))
-    diff["late"] = np.average(np.array(diff["late"]))
-
-    return diff
+def cs_diff(frames: GameFrames, participant, opponent):
+    """
+    Average creep score difference of a participant to its lane opponent, overall and per game state.
+
+    :param frames: frames of the game containing both participants
+    :param participant: participant id
+    :param opponent: participant id of the lane opponent
+    :return: dictionary of overall, early, mid and late creep score difference
+    """
+    return {phase: diffs[0] for phase, diffs in cs_diffs([(frames, participant, opponent)]).items()}
 
 
 def common_stats(
     common_games,
+    conn,
 ):
-    conn = database.get_connection()
     games = 0
 
     dkills = 0
@@ -1,18 +1,17 @@
-import ast
-import pickle
-
 import numpy as np
 
-import database
-from enums import Constants, Objectives
+import models
+from analysis import frames as frame_store
+from enums import Constants, Objectives, Together
 
 
 def classify_murderous_duo(p1_kp, p2_kp, p1_kda, p2_kda):
-    model = pickle.load(open('/analyzer/kmeans_murderous.pkl', 'rb'))
-    centres = model.cluster_centers_.tolist()
-    prediction = model.predict([[p1_kp, p1_kda], [p2_kp, p2_kda]])
+    loaded = models.registry.get('murderous')
+    centres = loaded.model.cluster_centers_.tolist()
+    prediction = loaded.model.predict([[p1_kp, p1_kda], [p2_kp, p2_kda]])
 
     return {
+        "model_version": loaded.version,
         "cluster_centre": {
             "0": centres[0],
             "1": centres[1]
@@ -29,11 +28,12 @@ def classify_murderous_duo(p1_kp, p2_kp, p1_kda, p2_kda):
 
 
 def classify_farmer_type(p1_cs, p2_cs, p1_csd, p2_csd):
-    model = pickle.load(open('/analyzer/kmeans_farmers.pkl', 'rb'))
-    centres = model.cluster_centers_.tolist()
-    prediction = model.predict([[p1_cs, p1_csd], [p2_cs, p2_csd]])
+    loaded = models.registry.get('farmers')
+    centres = loaded.model.cluster_centers_.tolist()
+    prediction = loaded.model.predict([[p1_cs, p1_csd], [p2_cs, p2_csd]])
 
     return {
+        "model_version": loaded.version,
         "cluster_centre": {
             "0": centres[0],
             "1": centres[1]
@@ -50,11 +50,12 @@ def classify_farmer_type(p1_cs, p2_cs, p1_csd, p2_csd):
 
 
 def classify_tactician(p1_worth, p2_worth, p1_obj, p2_obj):
-    model = pickle.load(open('/analyzer/kmeans_tactician.pkl', 'rb'))
-    centres = model.cluster_centers_.tolist()
-    prediction = model.predict([[p1_worth, p1_obj], [p2_worth, p2_obj]])
+    loaded = models.registry.get('tactician')
+    centres = loaded.model.cluster_centers_.tolist()
+    prediction = loaded.model.predict([[p1_worth, p1_obj], [p2_worth, p2_obj]])
 
     return {
+        "model_version": loaded.version,
         "cluster_centre": {
             "0": centres[1],
             "1": centres[0]
@@ -70,101 +71,106 @@ def classify_tactician(p1_worth, p2_worth, p1_obj, p2_obj):
     }
 
 
-def _follow_kills(idx, kill_frames, kill_time, kill_position):
-    b = True
-    counter = idx + 1
-    f_kills = []
-    while b:
-        if counter > len(kill_frames) - 1:
-            break
-        position = ast.literal_eval(kill_frames[counter]["position"])
-        i_kill_time = kill_frames[counter]["timestamp"] / 60000
-        time_diff = abs(kill_time - i_kill_time)
-
-        if time_diff >= 1:
-            break
-
-        radius = Constants.FIGHT_RADIUS + Constants.FIGHT_RADIUS * time_diff
-
-        circle_dist = pow(position[0] - kill_position[0], 2) + pow(position[1] - kill_position[1], 2)
-        if circle_dist < pow(radius, 2):
-            f_kills.append(kill_frames[counter])
-            counter += 1
-        else:
-            b = False
-    return f_kills
-
-
-def tactician(participant, team_id, kill_frames, objective_frames, position_frames, conn):
-    skip_frames = 0
-    worthness = []
-    objectives = []
-
-    for idx, kill in enumerate(kill_frames):
-        if skip_frames > 0:
-            skip_frames -= 1
-            continue
-
-        if kill["killer"] == participant or kill["victim"] == participant \
-                or participant in kill["assistingparticipantids"]:
-            kill_position = ast.literal_eval(kill["position"])
-            kill_time = kill["timestamp"] / Constants.TIME
-
-            fight_kills = [kill]
-
-            follow_kills = _follow_kills(idx, kill_frames, kill_time, kill_position)
-            for follow_kill in follow_kills:
-                fight_kills.append(follow_kill)
-            skip_frames += len(follow_kills)
-
-            members = {
-                "blue": {"overall": 0, "alive": 0, "dead": 0},
-                "red": {"overall": 0, "alive": 0, "dead": 0}
-            }
-            objectives_game = 0
-            for fight_kill in fight_kills:
-                fight_kill_time = fight_kill["timestamp"] / 60000
-                affected_frames = position_frames[10 * round(fight_kill_time):10 * round(fight_kill_time) + 9]
-                fight_members = _count_fight_members(fight_kill, affected_frames, conn)
-                members["blue"]["overall"] = max(fight_members["blue"]["overall"], members["blue"]["overall"])
-                members["blue"]["alive"] = max(fight_members["blue"]["overall"], members["blue"]["alive"])
-                members["blue"]["dead"] = max(fight_members["blue"]["overall"], members["blue"]["dead"])
-                members["red"]["overall"] = max(fight_members["red"]["overall"], members["red"]["overall"])
-                members["red"]["alive"] = max(fight_members["blue"]["overall"], members["red"]["alive"])
-                members["red"]["dead"] = max(fight_members["blue"]["overall"], members["red"]["dead"])
-
-                objectives_game += check_objectives(fight_kill, objective_frames)
-
-            objectives.append(objectives_game)
-            worthness.append(is_worth_fight(members, team_id))
+def time_together(pairs, thresholds=(Together.DIST,)):
+    """
+    Share of the frames in which two participants were close to each other, for many games and thresholds at once.
+
+    :param pairs: (frames, participant 1, participant 2) per game; the frames of participant 1 define the game length
+    :param thresholds: distances up to which the two participants count as together
+    :return: {"games": [threshold, game] shares, "overall": [threshold] average share over the games}
+    """
+    x1 = frame_store.stack([frames.column("x", p1) for frames, p1, _ in pairs])
+    y1 = frame_store.stack([frames.column("y", p1) for frames, p1, _ in pairs])
+    x2 = frame_store.stack([_aligned(frames, "x", p2, frames.column("x", p1)) for frames, p1, p2 in pairs],
+                           width=x1.shape[1])
+    y2 = frame_store.stack([_aligned(frames, "y", p2, frames.column("y", p1)) for frames, p1, p2 in pairs],
+                           width=x1.shape[1])
+    minutes = np.array([len(frames.column("x", p1)) for frames, p1, _ in pairs], dtype=float)
+
+    # frames without a position on either side are NaN and never count as together
+    distance = np.hypot(x1 - x2, y1 - y2)
+    thresholds = np.asarray(thresholds, dtype=float)
+    together = np.count_nonzero(distance[np.newaxis, :, :] <= thresholds[:, np.newaxis, np.newaxis], axis=2)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        games = np.where(minutes > 0, together / minutes, 0)
+    overall = games.mean(axis=1) if len(pairs) > 0 else np.full(len(thresholds), np.nan)
+    return {"games": games, "overall": overall}
+
+
+def _aligned(frames, field, participant, reference):
+    """ Column of a participant cut or NaN padded to the length of `reference`. """
+    if participant not in frames:
+        return np.full(len(reference), np.nan)
+    return getattr(frames, field)[:len(reference), frames.index(participant)]
+
+
+def tactician(participant, team_id, fights):
+    """
+    Calculate how worth the fights of a participant were and which objectives followed them.
+
+    :param participant: participant id
+    :param team_id: team of the participant
+    :param fights: fight table of the game, see `analysis.fights.FightTable`
+    :return: average worthness and objective score of the participant's fights
+    """
+    participant_fights = fights.fights(participant)
+    worthness = [is_worth_fight(fights.fight_members(fight), team_id) for fight in participant_fights]
 
     return {
-        "worthness": np.nanmean(np.array(worthness)),
-        "objectives": np.nanmean(np.array(objectives))
+        "worthness": np.nanmean(np.array(worthness, dtype=float)),
+        "objectives": np.nanmean(fights.objectives[participant_fights])
     }
 
 
-def check_objectives(kill, objective_frames):
-    kill_time = kill["timestamp"] / 60000
-    objectives = 0
-
-    for objective_frame in objective_frames:
-        objective_time = objective_frame["timestamp"] / 60000
-        if kill_time < objective_time < kill_time + 2:
-            objective_type = objective_frame["type"]
-            if objective_type == 'ELITE_MONSTER_KILL':
-                monster_type = objective_frame["monstertype"]
-                monster_subtype = objective_frame["monstersubtype"]
-                if monster_type == 'DRAGON':
-                    if monster_subtype != 'ELDER_DRAGON':
-                        monster_type = 'ELEMENTAL_DRAGON'
-                objectives += _objective_value(objective_type, monster_type)
-            elif objective_type == 'BUILDING_KILL':
-                building_type = objective_frame['towertype']
-                objectives += _objective_value(objective_type, building_type)
-        else:
-            break
-    return objectives
+class ObjectiveTimeline:
+    """
+    Objectives of a game sorted by time, with the value of every objective precomputed.
+
+    The value of all objectives taken in a time window is the difference of two prefix sums found by binary search.
+    """
+
+    # objectives up to this many milliseconds after a kill follow from it
+    WINDOW = 2 * Constants.TIME
+
+    def __init__(self, objective_frames):
+        timestamps = np.array([frame["timestamp"] for frame in objective_frames], dtype=float)
+        values = np.array([_frame_value(frame) for frame in objective_frames], dtype=float)
+        order = np.argsort(timestamps, kind="stable")
+        self.timestamps = timestamps[order]
+        self._cumulative = np.concatenate(([0.0], np.cumsum(values[order])))
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    def value(self, start, end):
+        """ Value of the objectives taken in (start, end], for scalars or arrays of timestamps. """
+        lo = np.searchsorted(self.timestamps, start, side="right")
+        hi = np.searchsorted(self.timestamps, end, side="right")
+        return self._cumulative[np.maximum(hi, lo)] - self._cumulative[lo]
+
+    def after(self, timestamps):
+        """ Value of the objectives taken within WINDOW after each of the given timestamps. """
+        timestamps = np.asarray(timestamps, dtype=float)
+        return self.value(timestamps, timestamps + self.WINDOW)
+
+
+def check_objectives(kill, timeline: ObjectiveTimeline):
+    """ Value of the objectives taken up to two minutes after a kill. """
+    return float(timeline.after(kill["timestamp"]))
+
+
+def _frame_value(objective_frame):
+    objective_type = objective_frame["type"]
+    if objective_type == 'ELITE_MONSTER_KILL':
+        monster_type = objective_frame["monstertype"]
+        monster_subtype = objective_frame["monstersubtype"]
+        if monster_type == 'DRAGON':
+            monster_type = 'ELDER_DRAGON' if monster_subtype == 'ELDER_DRAGON' else 'ELEMENTAL_DRAGON'
+        return _objective_value(objective_type, monster_type)
+    elif objective_type == 'BUILDING_KILL':
+        building_type = objective_frame['towertype']
+        return _objective_value(objective_type, building_type)
+    return 0
 
 
 def _objective_value(obj_type, obj_subtype):
@@ -220,41 +226,3 @@ def is_worth_fight(members, team_id):
         return -1
     elif not numbers_advantage and not lost:
         return 2
-
-
-def _count_fight_members(kill, time_frames, conn):
-    members = {
-        "blue": {"overall": 0, "alive": 0, "dead": 0},
-        "red": {"overall": 0, "alive": 0, "dead": 0}
-    }
-
-    kill_time = kill["timestamp"] / 60000
-    if kill["position"] is None:
-        return members
-    kill_position = ast.literal_eval(kill["position"])
-    time_diff = abs((round(kill_time) - kill_time))
-    radius = Constants.FIGHT_RADIUS + Constants.FIGHT_RADIUS * time_diff
-    for time_frame in time_frames:
-        if time_frame["timestamp"] % (round(kill_time) * 60000) < 60000:
-            if time_frame["position"] is None:
-                break
-            frame_participant = time_frame["participantid"]
-            team = database.select_participant_team(conn=conn, participant_id=frame_participant)
-            key = "blue" if team[0]["teamid"] == 100 else "red"
-
-            if frame_participant == kill["killer"] or frame_participant in kill["assistingparticipantids"]:
-                members[key]["overall"] += 1
-                members[key]["alive"] += 1
-                continue
-            elif frame_participant == kill["victim"]:
-                members[key]["overall"] += 1
-                members[key]["dead"] += 1
-                continue
-
-            position = ast.literal_eval(time_frame["position"])
-            circle_dist = pow(position[0] - kill_position[0], 2) + pow(position[1] - kill_position[1], 2)
-            if circle_dist < pow(radius, 2):
-                members[key]["overall"] += 1
-                members[key]["alive"] += 1
-
-    return members
@@ -1,6 +1,7 @@
 """ Calculate metrics which correlate to 'combinations'. """
 from collections import defaultdict
 
+import champions
 import database
 import model
 
@@ -20,13 +21,18 @@ def team_champions(s1: model.Summoner, s2: model.Summoner, conn):
 
     # get statistics for common games of summoner 1 and summoner 2
     game_stats = database.select_common_game_stats(conn=conn, s1=s1, s2=s2)
+    champion_names = champions.catalogue.get(conn)
     # iterate over every 2nd entry aka each game and aggregate wins and total games
 
     for game_stat in game_stats:
-        p1_champion = database.select_champion_name_id(champ_id=game_stat["s1_champion"], conn=conn)
-        p2_champion = database.select_champion_name_id(champ_id=game_stat["s2_champion"], conn=conn)
-
-        champ_set = (p1_champion['name'], p2_champion['name'])
+        p1_champion = champion_names.get(game_stat["s1_champion"])
+        p2_champion = champion_names.get(game_stat["s2_champion"])
+        if p1_champion is None or p2_champion is None:
+            # champion released after the last refresh of the catalogue
+            p1_champion = champions.catalogue.name(game_stat["s1_champion"], conn=conn)
+            p2_champion = champions.catalogue.name(game_stat["s2_champion"], conn=conn)
+
+        champ_set = (p1_champion, p2_champion)
         champ_matrix[champ_set]['total'] += 1
         champ_matrix[champ_set]['wins'] += win_value[game_stat['win']]
 
@@ -0,0 +1,179 @@
+""" Fights of a game, clustered once from its kill timeline. """
+import numpy as np
+
+from analysis.classification import ObjectiveTimeline
+from analysis.frames import GameFrames
+from enums import Constants
+
+TEAMS = ("blue", "red")
+MEMBERS = ("overall", "alive", "dead")
+
+
+class FightTable:
+    """
+    Fights of one game as NumPy columns indexed by fight id.
+
+    A fight starts at the first kill not yet assigned to a fight and takes all following kills close to it in time
+    and place. Member counts are the per-team maximum over the kills of the fight.
+    """
+
+    def __init__(self, kill_fight, start, end, centroid, members, objectives, involved):
+        self.kill_fight = kill_fight
+        self.start = start
+        self.end = end
+        self.centroid = centroid
+        self.members = members
+        self.objectives = objectives
+        self._involved = involved
+
+    @classmethod
+    def build(cls, kills, objectives, frames: GameFrames, teams):
+        """
+        Cluster the kills of a game into fights.
+
+        :param kills: decoded kill timeline of the game, ordered by timestamp
+        :param objectives: objective timeline of the game, in any order
+        :param frames: columnar frames of all participants of the game
+        :param teams: mapping of every participant id of the game to its team id
+        :return: fight table
+        """
+        positions = np.full((len(kills), 2), np.nan)
+        for idx, kill in enumerate(kills):
+            if kill["position"] is not None:
+                positions[idx] = kill["position"]
+
+        firsts = []
+        idx = 0
+        while idx < len(kills):
+            firsts.append(idx)
+            if kills[idx]["position"] is None:
+                idx += 1
+            else:
+                idx += 1 + len(_follow_kills(idx, kills, kills[idx]["timestamp"] / Constants.TIME, positions[idx]))
+        firsts = np.array(firsts, dtype=np.int64)
+        lasts = np.append(firsts[1:], len(kills)) - 1
+
+        kill_fight = np.zeros(len(kills), dtype=np.int64)
+        kill_fight[firsts[1:]] = 1
+        kill_fight = np.cumsum(kill_fight)
+
+        timestamps = np.array([kill["timestamp"] for kill in kills], dtype=float)
+        located = ~np.isnan(positions[:, 0])
+        if len(kills) > 0:
+            count = np.add.reduceat(located.astype(float), firsts)
+            with np.errstate(invalid="ignore"):
+                centroid = np.add.reduceat(np.where(located[:, np.newaxis], positions, 0), firsts) / count[:, np.newaxis]
+            members = np.maximum.reduceat(_kill_members(kills, positions, frames, teams), firsts)
+        else:
+            centroid = np.empty((0, 2))
+            members = np.zeros((0, len(TEAMS), len(MEMBERS)), dtype=np.int64)
+
+        kill_objectives = ObjectiveTimeline(objectives).after(timestamps)
+        fight_objectives = np.add.reduceat(kill_objectives, firsts) if len(kills) > 0 else np.empty(0)
+
+        involved = {}
+        for fight, kill in zip(kill_fight, kills):
+            for participant in [kill["killer"], kill["victim"], *kill["assistingparticipantids"]]:
+                fights = involved.setdefault(participant, [])
+                if len(fights) == 0 or fights[-1] != fight:
+                    fights.append(fight)
+
+        return cls(
+            kill_fight=kill_fight,
+            start=timestamps[firsts] if len(kills) > 0 else np.empty(0),
+            end=timestamps[lasts] if len(kills) > 0 else np.empty(0),
+            centroid=centroid,
+            members=members,
+            objectives=fight_objectives,
+            involved={participant: np.array(fights, dtype=np.int64) for participant, fights in involved.items()},
+        )
+
+    def __len__(self):
+        return len(self.start)
+
+    def kills(self, fight):
+        """ Indices into the kill timeline of the kills of a fight. """
+        return np.flatnonzero(self.kill_fight == fight)
+
+    def fights(self, participant):
+        """ Ids of the fights in which a participant killed, died or assisted. """
+        return self._involved.get(participant, np.empty(0, dtype=np.int64))
+
+    def fight_members(self, fight):
+        """ Member counts of a fight as {"blue": {"overall", "alive", "dead"}, "red": {...}}. """
+        return {
+            team: {field: int(self.members[fight, t, f]) for f, field in enumerate(MEMBERS)}
+            for t, team in enumerate(TEAMS)
+        }
+
+    def nbytes(self):
+        return sum(column.nbytes for column in (
+            self.kill_fight, self.start, self.end, self.centroid, self.members, self.objectives
+        )) + sum(fights.nbytes for fights in self._involved.values())
+
+
+def _follow_kills(idx, kill_frames, kill_time, kill_position):
+    b = True
+    counter = idx + 1
+    f_kills = []
+    while b:
+        if counter > len(kill_frames) - 1:
+            break
+        position = kill_frames[counter]["position"]
+        if position is None:
+            break
+        i_kill_time = kill_frames[counter]["timestamp"] / 60000
+        time_diff = abs(kill_time - i_kill_time)
+
+        if time_diff >= 1:
+            break
+
+        radius = Constants.FIGHT_RADIUS + Constants.FIGHT_RADIUS * time_diff
+
+        circle_dist = pow(position[0] - kill_position[0], 2) + pow(position[1] - kill_position[1], 2)
+        if circle_dist < pow(radius, 2):
+            f_kills.append(kill_frames[counter])
+            counter += 1
+        else:
+            b = False
+    return f_kills
+
+
+def _kill_members(kills, positions, frames: GameFrames, teams):
+    """
+    Per-team member counts of every kill, indexed [kill, team, overall/alive/dead].
+
+    Killer, assistants and victim are members of a kill, everyone else only if they are within the fight radius in
+    the frame closest to the kill. Only participants with a frame at that minute count; kills without a position
+    have no members.
+    """
+    counts = np.zeros((len(kills), len(TEAMS), len(MEMBERS)), dtype=np.int64)
+    if frames.x.shape[0] == 0:
+        return counts
+
+    kill_time = np.array([kill["timestamp"] for kill in kills], dtype=float) / Constants.TIME
+    minute = np.round(kill_time).astype(np.int64)
+    radius = Constants.FIGHT_RADIUS + Constants.FIGHT_RADIUS * np.abs(minute - kill_time)
+    rows = np.minimum(minute, frames.x.shape[0] - 1)
+
+    recorded = minute[:, np.newaxis] < frames.lengths[np.newaxis, :]
+    recorded &= ~np.isnan(positions[:, 0, np.newaxis])
+    circle_dist = (frames.x[rows] - positions[:, 0, np.newaxis]) ** 2 \
+        + (frames.y[rows] - positions[:, 1, np.newaxis]) ** 2
+    in_radius = circle_dist < radius[:, np.newaxis] ** 2
+
+    participants = np.array(frames.participants)
+    killers = np.array([kill["killer"] for kill in kills])
+    victims = np.array([kill["victim"] for kill in kills])
+    assisting = np.array([[participant in kill["assistingparticipantids"] for participant in frames.participants]
+                          for kill in kills], dtype=bool).reshape(len(kills), len(participants))
+
+    dead = recorded & (participants[np.newaxis, :] == victims[:, np.newaxis])
+    alive = recorded & ~dead & ((participants[np.newaxis, :] == killers[:, np.newaxis]) | assisting | in_radius)
+
+    red = np.array([teams[participant] != 100 for participant in frames.participants], dtype=bool)
+    for t, team in enumerate((~red, red)):
+        counts[:, t, 1] = np.count_nonzero(alive & team, axis=1)
+        counts[:, t, 2] = np.count_nonzero(dead & team, axis=1)
+    counts[:, :, 0] = counts[:, :, 1] + counts[:, :, 2]
+    return counts
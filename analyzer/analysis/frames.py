@@ -0,0 +1,89 @@
+""" Columnar storage of participant frames. """
+import numpy as np
+
+
+class GameFrames:
+    """
+    Per-minute participant frames of one game as NumPy arrays indexed [minute, participant].
+
+    Each participant's frames are ordered by timestamp, so row `i` of a column holds the `i`-th frame of that
+    participant. Participants with fewer frames and frames without a position are padded with NaN.
+    """
+
+    FIELDS = ("timestamp", "x", "y", "totalgold", "minionskilled", "jungleminionskilled")
+
+    def __init__(self, participants, lengths, columns):
+        self.participants = participants
+        self.lengths = lengths
+        self._index = {participant: idx for idx, participant in enumerate(participants)}
+        for field in self.FIELDS:
+            setattr(self, field, columns[field])
+
+    @classmethod
+    def from_rows(cls, rows):
+        """
+        Build the arrays from participant frame rows.
+
+        :param rows: decoded participant frame rows of one game, in any participant order
+        :return: columnar frames
+        """
+        by_participant = {}
+        for row in sorted(rows, key=lambda r: r["timestamp"]):
+            by_participant.setdefault(row["participantid"], []).append(row)
+
+        participants = sorted(by_participant)
+        lengths = np.array([len(by_participant[p]) for p in participants], dtype=np.int64)
+        shape = (int(lengths.max()) if len(participants) > 0 else 0, len(participants))
+        columns = {field: np.full(shape, np.nan) for field in cls.FIELDS}
+
+        for col, participant in enumerate(participants):
+            for minute, row in enumerate(by_participant[participant]):
+                columns["timestamp"][minute, col] = row["timestamp"]
+                columns["totalgold"][minute, col] = row["totalgold"]
+                columns["minionskilled"][minute, col] = row["minionskilled"]
+                columns["jungleminionskilled"][minute, col] = row["jungleminionskilled"]
+                if row["position"] is not None:
+                    columns["x"][minute, col], columns["y"][minute, col] = row["position"]
+
+        return cls(participants, lengths, columns)
+
+    def __contains__(self, participant):
+        return participant in self._index
+
+    def index(self, participant):
+        return self._index[participant]
+
+    def length(self, participant):
+        """ Number of frames recorded for a participant. """
+        return int(self.lengths[self._index[participant]])
+
+    def column(self, field, participant):
+        """ Frames of one field for a participant, cut to the number of frames recorded for it. """
+        if participant not in self._index:
+            return np.empty(0)
+        idx = self._index[participant]
+        return getattr(self, field)[:self.lengths[idx], idx]
+
+    def cs(self, participant):
+        """ Minion plus jungle minion kills per frame of a participant. """
+        return self.column("minionskilled", participant) + self.column("jungleminionskilled", participant)
+
+    def nbytes(self):
+        return sum(getattr(self, field).nbytes for field in self.FIELDS)
+
+
+def stack(columns, width=None):
+    """
+    Stack 1-D columns of different length into one NaN padded array indexed [row, minute].
+
+    :param columns: per-minute values, e.g. one participant column per game
+    :param width: number of minutes of the result, defaults to the longest column
+    :return: 2-D array
+    """
+    if width is None:
+        width = max((len(column) for column in columns), default=0)
+    stacked = np.full((len(columns), width), np.nan)
+    for row, column in enumerate(columns):
+        column = column[:width]
+        stacked[row, :len(column)] = column
+    return stacked
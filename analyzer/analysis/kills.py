@@ -0,0 +1,102 @@
+""" Per-participant kill statistics of a game, computed for all participants in one pass. """
+import numpy as np
+
+from analysis import regions
+from enums import Side
+
+
+class KillTable:
+    """
+    Kill counts of every participant of one game as NumPy arrays indexed [team, participant].
+
+    The team axis is the team that got the kill, so a participant's deaths are found in the row of the enemy team.
+    `takedowns` counts kills a participant killed or assisted, `forward` the takedowns with a position on the enemy
+    half of the map.
+    """
+
+    FIELDS = ("kills", "deaths", "assists", "takedowns", "forward")
+
+    def __init__(self, teams, participants, team_kills, columns):
+        self.teams = teams
+        self.participants = participants
+        self.team_kills = team_kills
+        self._team_index = {team: idx for idx, team in enumerate(teams)}
+        self._index = {participant: idx for idx, participant in enumerate(participants)}
+        for field in self.FIELDS:
+            setattr(self, field, columns[field])
+
+    @classmethod
+    def build(cls, kills):
+        """
+        Count the kill events of a game for all participants at once.
+
+        :param kills: decoded kill timeline of a game or of one of its teams
+        :return: kill table
+        """
+        teams = sorted({kill["teamid"] for kill in kills})
+        participants = sorted({participant for kill in kills
+                               for participant in (kill["killer"], kill["victim"], *kill["assistingparticipantids"])})
+        index = {participant: idx for idx, participant in enumerate(participants)}
+
+        killer = np.zeros((len(kills), len(participants)), dtype=bool)
+        victim = np.zeros((len(kills), len(participants)), dtype=bool)
+        assist = np.zeros((len(kills), len(participants)), dtype=bool)
+        team = np.zeros((len(kills), len(teams)), dtype=bool)
+        positions = np.full((len(kills), 2), np.nan)
+        forward_side = np.zeros(len(kills), dtype=np.int8)
+        for idx, kill in enumerate(kills):
+            killer[idx, index[kill["killer"]]] = True
+            victim[idx, index[kill["victim"]]] = True
+            assist[idx, [index[participant] for participant in kill["assistingparticipantids"]]] = True
+            team[idx, teams.index(kill["teamid"])] = True
+            if kill["position"] is not None:
+                positions[idx] = kill["position"]
+            forward_side[idx] = Side.RED if kill["teamid"] == 100 else Side.BLUE
+
+        located = ~np.isnan(positions[:, 0])
+        sides = regions.raster.sides(*np.nan_to_num(positions).T)
+        forward = located & (sides == forward_side)
+        takedowns = killer | assist
+
+        # [kill, team]^T @ [kill, participant] sums the kills of every team per participant
+        team = team.astype(np.int64)
+        columns = {
+            "kills": team.T @ killer,
+            "deaths": team.T @ victim,
+            "assists": team.T @ assist,
+            "takedowns": team.T @ takedowns,
+            "forward": team.T @ (takedowns & forward[:, np.newaxis]),
+        }
+        return cls(teams, participants, team.sum(axis=0), columns)
+
+    def count(self, field, participant, team_id=None):
+        """ Count of a participant in kills of one team, or in all kills of the table. """
+        if participant not in self._index:
+            return 0
+        column = getattr(self, field)[:, self._index[participant]]
+        if team_id is None:
+            return int(column.sum())
+        if team_id not in self._team_index:
+            return 0
+        return int(column[self._team_index[team_id]])
+
+    def total(self, team_id=None):
+        """ Number of kills of one team, or of all kills of the table. """
+        if team_id is None:
+            return int(self.team_kills.sum())
+        if team_id not in self._team_index:
+            return 0
+        return int(self.team_kills[self._team_index[team_id]])
+
+    def kill_participation(self, participant, team_id=None):
+        """ Share of the kills a participant killed or assisted, 0 if there were none. """
+        total = self.total(team_id)
+        return self.count("takedowns", participant, team_id) / total if total > 0 else 0
+
+    def forward_kills(self, participant, team_id=None):
+        """ Share of the kills a participant took part in on the enemy half of the map, 0 if there were none. """
+        total = self.total(team_id)
+        return self.count("forward", participant, team_id) / total if total > 0 else 0
+
+    def nbytes(self):
+        return sum(getattr(self, field).nbytes for field in self.FIELDS)
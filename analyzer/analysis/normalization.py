@@ -0,0 +1,53 @@
+""" Distributions of the per-game metrics, scoring whole arrays of values without scipy's frozen distributions. """
+import math
+
+import numpy as np
+
+import enums
+
+
+class Normal:
+    def __init__(self, mu, sigma):
+        self.mu = mu
+        self.sigma = sigma
+
+    def cdf(self, values):
+        """
+        Cumulative probability of a scalar or array of values; NaN stays NaN.
+
+        Uses erfc instead of 1 + erf, which cancels in the lower tail and rounds to 0 below about -8.3 sigma.
+        """
+        if np.ndim(values) == 0:
+            return 0.5 * math.erfc(-(values - self.mu) / (self.sigma * math.sqrt(2)))
+        # scipy is only needed for arrays, keep it out of the import of every view
+        from scipy.special import ndtr
+        return ndtr((np.asarray(values, dtype=float) - self.mu) / self.sigma)
+
+    def standardize(self, values):
+        return (values - self.mu) / self.sigma
+
+
+class Exponential:
+    def __init__(self, scale):
+        self.scale = scale
+
+    def cdf(self, values):
+        """ Cumulative probability of a scalar or array of values; NaN stays NaN. """
+        if np.ndim(values) == 0:
+            return 0.0 if values < 0 else -math.expm1(-values / self.scale)
+        values = np.asarray(values, dtype=float)
+        with np.errstate(over="ignore"):
+            return np.where(values < 0, 0.0, -np.expm1(-values / self.scale))
+
+
+KP = Normal(enums.KP.MU, enums.KP.SIG)
+FWK = Exponential(enums.FWK.MU)
+POS = Normal(enums.POS.MU, enums.POS.SIG)
+GANKING = Exponential(enums.Ganking.MU)
+GOLD_SHARE = Normal(enums.GoldShare.MU, enums.GoldShare.SIG)
+GOLD_DIFF = Normal(enums.GoldDiffAll.MU, enums.GoldDiffAll.SIG)
+CREEP_SHARE = Normal(enums.CreepShare.MU, enums.CreepShare.SIG)
+CSD = Normal(enums.CSD.MU, enums.CSD.SIG)
+WORTHNESS = Normal(enums.Worthness.MU, enums.Worthness.SIG)
+KILL_OBJECTIVES = Exponential(enums.KillObjectives.MU)
+KDA = Exponential(enums.KDA.MU)
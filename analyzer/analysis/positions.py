@@ -0,0 +1,39 @@
+""" Decoding of the position strings stored with frames and events. """
+import numpy as np
+
+_BRACKETS = str.maketrans('', '', '()[] ')
+
+
+def decode_many(positions):
+    """
+    Decode a sequence of position strings such as '(1234, 5678)' in one pass.
+
+    :param positions: position strings, None for unknown positions
+    :return: array of shape (n, 2), NaN where the position is None
+    :raises ValueError: if a position does not consist of two numbers
+    """
+    coords = np.full((len(positions), 2), np.nan)
+    present = [idx for idx, position in enumerate(positions) if position is not None]
+    if present:
+        # every string is checked for two fields, otherwise one malformed position would shift all later ones
+        malformed = [positions[idx] for idx in present if positions[idx].count(',') != 1]
+        if malformed:
+            raise ValueError(f'malformed position {malformed[0]!r}')
+        joined = ','.join(positions[idx] for idx in present).translate(_BRACKETS)
+        coords[present] = np.array(joined.split(','), dtype=float).reshape(-1, 2)
+    return coords
+
+
+def decode_rows(rows):
+    """
+    Copy frame or event rows with their position string replaced by an (x, y) tuple, or None if unknown.
+
+    Analysis functions expect decoded rows, so positions are parsed once per loaded game instead of once per use.
+    """
+    coords = decode_many([row["position"] for row in rows])
+    decoded = []
+    for row, (x, y) in zip(rows, coords.tolist()):
+        row = dict(row)
+        row["position"] = None if np.isnan(x) else (x, y)
+        decoded.append(row)
+    return decoded
@@ -0,0 +1,89 @@
+""" Raster of the map regions, so positions are classified by an array lookup instead of line distances. """
+import math
+
+import numpy as np
+
+from enums import Constants, Map, Region, Role, Side
+
+# lane lines as (gradient, b, c, side) of gradient * x + b * y + c = 0, the lane lies on the given side of the line
+LANE_LINES = {
+    Region.TOP_LANE: (6712 / 6431, -1, 5120.93, -1),
+    Region.MID_LANE: (Map.CENTER[1] / Map.CENTER[0], -1, 0, 0),
+    Region.BOT_LANE: (6743 / 6408, -1, -5797.71, 1),
+}
+# distance from a lane line up to which a position still belongs to the lane
+LANE_WIDTH = 1000
+LANES = {
+    Role.TOP: Region.TOP_LANE,
+    Role.MID: Region.MID_LANE,
+    Role.BOT: Region.BOT_LANE,
+    Role.SUP: Region.BOT_LANE,
+}
+
+
+def distance(x, y, gradient, b=1, c=1):
+    """ Signed distance of positions to the line gradient * x + b * y + c = 0. """
+    norm = math.sqrt(pow(gradient, 2) + pow(b, 2))
+    return (gradient * x + b * y + c) / norm
+
+
+def diagonal_distance(x, y):
+    """ Signed distance to the river diagonal, positive towards the red base. """
+    return distance(x, y, Map.HEIGHT / Map.WIDTH, c=-Map.HEIGHT)
+
+
+class MapRaster:
+    """
+    Side, diagonal distance band and region of every `cell` × `cell` square of the map.
+
+    Layers are indexed [row, column] with row = y // cell and column = x // cell; positions outside the map are
+    clamped to the closest border cell. The band of a cell is its diagonal distance in multiples of DIST_EPS,
+    rounded towards the blue base.
+    """
+
+    def __init__(self, cell=50):
+        self.cell = cell
+        self.shape = (math.ceil(Map.HEIGHT / cell) + 1, math.ceil(Map.WIDTH / cell) + 1)
+        y, x = np.mgrid[0:self.shape[0], 0:self.shape[1]]
+        x = (x + 0.5) * cell
+        y = (y + 0.5) * cell
+
+        diagonal = diagonal_distance(x, y)
+        self.side = np.select(
+            [diagonal > Constants.DIST_EPS, diagonal < -Constants.DIST_EPS], [Side.RED, Side.BLUE], Side.NEUTRAL
+        ).astype(np.int8)
+        self.band = np.clip(np.floor(diagonal / Constants.DIST_EPS), -128, 127).astype(np.int8)
+
+        region = np.where(np.abs(diagonal) <= Constants.DIST_EPS, Region.RIVER, Region.JUNGLE)
+        for lane in (Region.MID_LANE, Region.BOT_LANE, Region.TOP_LANE):
+            gradient, b, c, side = LANE_LINES[lane]
+            lane_distance = distance(x, y, gradient=gradient, b=b, c=c)
+            if side == 0:
+                in_lane = np.abs(lane_distance) < LANE_WIDTH
+            else:
+                in_lane = lane_distance * -side < LANE_WIDTH
+            region = np.where(in_lane, lane, region)
+        self.region = region.astype(np.int8)
+
+    def cells(self, x, y):
+        """ Row and column of the cells of positions. Positions must not be NaN. """
+        rows = np.clip(np.asarray(y) // self.cell, 0, self.shape[0] - 1).astype(np.intp)
+        columns = np.clip(np.asarray(x) // self.cell, 0, self.shape[1] - 1).astype(np.intp)
+        return rows, columns
+
+    def sides(self, x, y):
+        """ Side of the map of positions, see `enums.Side`. """
+        return self.side[self.cells(x, y)]
+
+    def bands(self, x, y):
+        return self.band[self.cells(x, y)]
+
+    def regions(self, x, y):
+        """ Region of positions, see `enums.Region`. """
+        return self.region[self.cells(x, y)]
+
+    def nbytes(self):
+        return self.side.nbytes + self.band.nbytes + self.region.nbytes
+
+
+raster = MapRaster()
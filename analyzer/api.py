@@ -1,15 +1,31 @@
-import falcon
+import startup
 
-import views
-import database
-import util
+with startup.ImportTimer() as imports:
+    import falcon
+
+    import aggregates
+    import champions
+    import features
+    import jobs
+    import models
+    import views
+    import pool
+    import sessions
+    import summoners
+    import util
 
 
 logger = util.Logger(__name__)
 
 
 def create():
-    api = falcon.App(cors_enable=True)
+    connection_pool = pool.ConnectionPool.from_env()
+    api = falcon.App(cors_enable=True, request_type=pool.PooledRequest,
+                     middleware=[pool.ConnectionMiddleware(connection_pool)])
+    api.add_error_handler(models.ModelUnavailable, _model_unavailable)
+    api.add_error_handler(aggregates.AggregatesUnavailable, _aggregates_unavailable)
+    # models are retrained in background jobs of this worker, poll /jobs/{job_id} for their progress
+    runner = jobs.JobRunner(connection_pool)
     api.add_route('/common-games', views.BaseMetrics.CommonGames())
     api.add_route('/winrate', views.BaseMetrics.WinRate())
     api.add_route('/kda', views.BaseMetrics.KDA())
@@ -31,19 +47,50 @@ def create():
     api.add_route('/average/basics', views.Averages.AverageBasics())
     api.add_route('/average/win-rate', views.Averages.AverageWinRate())
     api.add_route('/average/cs', views.Averages.AverageCs())
+    api.add_route('/average/update', views.Averages.AverageUpdate(runner))
+    api.add_route('/average/constants', views.Averages.AverageConstants())
+
+    api.add_route('/model/millionaire', views.ClassificationModel.MillionaireModel(runner))
+    api.add_route('/model/murderous-duo', views.ClassificationModel.MurderousDuoModel(runner))
+    api.add_route('/model/farmer-type', views.ClassificationModel.FarmerType(runner))
+    api.add_route('/model/tactician', views.ClassificationModel.TacticianModel(runner))
+    api.add_route('/jobs/{job_id}', views.ClassificationModel.Job(runner))
 
-    api.add_route('/model/millionaire', views.ClassificationModel.MillionaireModel())
-    api.add_route('/model/murderous-duo', views.ClassificationModel.MurderousDuoModel())
-    api.add_route('/model/farmer-type', views.ClassificationModel.FarmerType())
-    api.add_route('/model/tactician', views.ClassificationModel.TacticianModel())
+    api.add_route('/health/pool', views.Health.PoolStats(connection_pool))
+    api.add_route('/health/models', views.Health.ModelVersions(models.registry))
+    api.add_route('/health/features', views.Health.FeatureStats(features.store))
+    api.add_route('/health/cache', views.Health.CacheStats({
+        'summoners': summoners.cache,
+        'unknown_summoners': summoners.unknown,
+        'sessions': sessions.cache,
+    }))
 
     logger.info('falcon initialized')
+    logger.info(imports.report())
+    if startup.warm_up_enabled():
+        warm_up = startup.ImportTimer()
+        startup.warm_up(warm_up)
+        logger.info(f'warm-up {warm_up.report()}')
 
-    conn = database.get_connection()
-    database.kill_connection(conn)
-    logger.info('database is ready')
+    models.registry.load_all()
+
+    # open the first pooled connection right away so a misconfigured database fails at startup
+    conn = connection_pool.get()
+    try:
+        champions.catalogue.refresh(conn)
+    finally:
+        connection_pool.put(conn)
+    logger.info(f'database is ready (pool size {connection_pool.size}, timeout {connection_pool.timeout}s)')
 
     return api
 
 
+def _model_unavailable(req, resp, ex, params):
+    raise falcon.HTTPServiceUnavailable(description=f'model {ex} has not been trained yet')
+
+
+def _aggregates_unavailable(req, resp, ex, params):
+    raise falcon.HTTPServiceUnavailable(description='population aggregates have not been computed yet, POST /average/update')
+
+
 application = create()
@@ -0,0 +1,328 @@
+""" Load everything the duo endpoints need for the common games of two summoners in a few set-based queries. """
+import itertools
+import os
+import sys
+import uuid
+from collections import defaultdict
+
+import psycopg2.extras
+
+import database
+import model
+import util
+from analysis import positions
+from analysis.frames import GameFrames
+
+logger = util.Logger(__name__)
+
+# rows fetched per round trip when streaming all games
+FETCH_SIZE = int(os.getenv('ALL_GAMES_FETCH_SIZE', 2000))
+
+
+class CommonGamesBundle:
+    """
+    Indexed in-memory view of the common games of two summoners.
+
+    All lookups are plain dictionary accesses, so analysis code can iterate the common games without issuing any
+    further queries.
+    """
+
+    def __init__(self, games, participants, stats, frames, kills, objectives, team_totals):
+        self.games = games
+        self._rows = (games, participants, stats, frames, kills, objectives, team_totals)
+        self._participants = {p["participantid"]: p for p in participants}
+        self._teams = participant_teams(participants)
+        self._stats = {s["statid"]: s for s in stats}
+        self._team_totals = {(t["gameid"], t["teamid"]): t for t in team_totals}
+
+        game_frames = defaultdict(list)
+        for frame in frames:
+            game_frames[frame["gameid"]].append(frame)
+        self._frame_stores = {game_id: GameFrames.from_rows(rows) for game_id, rows in game_frames.items()}
+
+        self._kills = defaultdict(list)
+        for kill in kills:
+            self._kills[kill["gameid"]].append(kill)
+
+        self._objectives = defaultdict(list)
+        for objective in objectives:
+            self._objectives[objective["gameid"]].append(objective)
+
+        self._opponents = {}
+        positions = defaultdict(list)
+        for participant in participants:
+            positions[(participant["gameid"], participant["lane"], participant["role"])].append(participant)
+        for participant in participants:
+            key = (participant["gameid"], participant["lane"], participant["role"])
+            self._opponents[participant["participantid"]] = next(
+                (p for p in positions[key] if p["teamid"] != participant["teamid"]), None
+            )
+
+    def __len__(self):
+        return len(self.games)
+
+    def __iter__(self):
+        return iter(self.games)
+
+    def approximate_size(self, sample=32):
+        """ Estimate the memory held by the loaded rows in bytes, extrapolated from a sample of each table. """
+        size = 0
+        for rows in self._rows:
+            if not rows:
+                continue
+            sampled = list(itertools.islice(rows, sample))
+            sampled_size = sum(sys.getsizeof(row) + sum(sys.getsizeof(value) for value in row) for row in sampled)
+            size += sampled_size * len(rows) // len(sampled)
+        return size + sum(store.nbytes() for store in self._frame_stores.values())
+
+    def stats(self, statid):
+        return self._stats.get(statid)
+
+    def participant(self, participant_id):
+        """ Participant row with its game, team, stats id, lane and role. """
+        return self._participants[participant_id]
+
+    def participant_team(self, participant_id):
+        return self._participants[participant_id]["teamid"]
+
+    def participant_teams(self, game_id):
+        """ Mapping of every participant id of a game to its team id. """
+        return self._teams.get(game_id, {})
+
+    def frames(self, game_id) -> GameFrames:
+        """ Columnar frames of all participants of a game. """
+        return self._frame_stores.get(game_id) or GameFrames.from_rows([])
+
+    def opponent(self, participant_id):
+        """ Participant of the other team playing the same lane and role, or None. """
+        return self._opponents.get(participant_id)
+
+    def lane_games(self):
+        """ Common games in which both summoners have a lane opponent. """
+        return [game for game in self.games
+                if self.opponent(game["s1_participantid"]) is not None
+                and self.opponent(game["s2_participantid"]) is not None]
+
+    def lanes(self, games, summoner):
+        """ (frames, participant, lane opponent) of summoner 's1' or 's2' for each of the given games. """
+        return [(
+            self.frames(game["gameid"]),
+            game[f"{summoner}_participantid"],
+            self.opponent(game[f"{summoner}_participantid"])["participantid"],
+        ) for game in games]
+
+    def team_gold(self, game_id, team_id):
+        totals = self._team_totals.get((game_id, team_id))
+        return None if totals is None else totals["gold"]
+
+    def team_cs(self, game_id, team_id):
+        totals = self._team_totals.get((game_id, team_id))
+        return None if totals is None else totals["cs"]
+
+    def team_win(self, game_id, team_id):
+        """ Whether a team won its game, None if the game has no team row. """
+        totals = self._team_totals.get((game_id, team_id))
+        return None if totals is None or totals["win"] is None else totals["win"] == "Win"
+
+    def kills(self, game_id, team_id=None):
+        """ Kill timeline of a game, optionally restricted to kills of one team. """
+        kills = self._kills.get(game_id, [])
+        if team_id is None:
+            return kills
+        return [kill for kill in kills if kill["teamid"] == team_id]
+
+    def objectives(self, game_id):
+        return self._objectives.get(game_id, [])
+
+
+def load_common_games(conn, s1: model.Summoner, s2: model.Summoner) -> CommonGamesBundle:
+    """
+    Fetch the common games of summoner 1 and 2 together with all per-game data the duo endpoints use.
+
+    The number of queries is fixed, independent of the number of common games.
+
+    :param conn: database connection
+    :param s1: summoner 1
+    :param s2: summoner 2
+    :return: indexed bundle of common games
+    """
+    games = database.select_common_games(conn=conn, s1=s1, s2=s2)
+    return load_games(conn=conn, games=games)
+
+
+def load_games(conn, games) -> CommonGamesBundle:
+    """
+    Fetch all per-game data the duo endpoints use for already selected common games.
+
+    :param conn: database connection
+    :param games: rows as returned by database.select_common_games
+    :return: indexed bundle of the games
+    """
+    game_ids = list({game["gameid"] for game in games})
+    if not game_ids:
+        return CommonGamesBundle(games, [], [], [], [], [], [])
+
+    participants = select_participants(conn=conn, game_ids=game_ids)
+    stats = select_stats(conn=conn, stat_ids=[p["statid"] for p in participants])
+    frames = positions.decode_rows(select_frames(conn=conn, game_ids=game_ids))
+    kills = positions.decode_rows(select_kills(conn=conn, game_ids=game_ids))
+    objectives = select_objectives(conn=conn, game_ids=game_ids)
+    team_totals = select_team_totals(conn=conn, game_ids=game_ids)
+
+    logger.info(f'loaded bundle of {len(games)} common games')
+    return CommonGamesBundle(games, participants, stats, frames, kills, objectives, team_totals)
+
+
+def iter_all_games(conn, fetch_size: int = FETCH_SIZE):
+    """
+    Stream the rows of all games through a server-side cursor instead of loading them at once.
+
+    The rows have the shape of `database.select_all_games`, one per participant, and are ordered by game, so the
+    rows of a game are adjacent. Only `fetch_size` rows are held in memory at a time.
+
+    :param conn: database connection, the cursor lives in its current transaction
+    :param fetch_size: rows fetched per round trip
+    :return: iterator over the game rows
+    """
+    with conn.cursor(name=f'all_games_{uuid.uuid4().hex}', cursor_factory=psycopg2.extras.DictCursor) as cursor:
+        cursor.itersize = fetch_size
+        cursor.execute("""
+            SELECT p.gameid,
+                   p.participantid AS s1_participantid,
+                   p.teamid AS s1_teamid,
+                   p.statid AS s1_statid,
+                   p.lane AS s1_lane,
+                   p.role AS s1_role,
+                   t.win
+            FROM participant p
+            JOIN team t ON t.gameid = p.gameid AND t.teamid = p.teamid
+            ORDER BY p.gameid, p.participantid
+        """)
+        yield from cursor
+
+
+def select_average_win_rate(conn, min_games: int):
+    """
+    Average win rate of all summoners with at least `min_games` games, computed by the database in one query.
+
+    :param conn: database connection
+    :param min_games: least number of games a summoner needs to be counted
+    :return: row of wr, None if no summoner has enough games, and the number of summoners counted
+    """
+    return _fetch_all(conn, """
+        SELECT AVG(wins::float / games) AS wr,
+               COUNT(*) AS summoners
+        FROM (
+            SELECT COUNT(*) FILTER (WHERE t.win = 'Win') AS wins,
+                   COUNT(*) AS games
+            FROM summoner s
+            JOIN participant p ON p.accountid = s.accountid
+            JOIN team t ON t.gameid = p.gameid AND t.teamid = p.teamid
+            GROUP BY s.accountid
+            HAVING COUNT(*) >= %(min_games)s
+        ) AS win_rates
+    """, {"min_games": min_games})[0]
+
+
+def game_chunks(games, size: int):
+    """
+    Group a stream of game rows into lists of the rows of up to `size` games.
+
+    Rows of one game must be adjacent, as returned by `iter_all_games`, so no game is split across chunks.
+    """
+    chunk = []
+    game_ids = set()
+    for game in games:
+        if game["gameid"] not in game_ids and len(game_ids) == size:
+            yield chunk
+            chunk = []
+            game_ids = set()
+        game_ids.add(game["gameid"])
+        chunk.append(game)
+    if chunk:
+        yield chunk
+
+
+def participant_teams(participants):
+    """
+    Group participant rows into a participant id to team id mapping per game.
+
+    :param participants: rows as returned by select_participants
+    :return: {game id: {participant id: team id}}
+    """
+    teams = defaultdict(dict)
+    for participant in participants:
+        teams[participant["gameid"]][participant["participantid"]] = participant["teamid"]
+    return teams
+
+
+def _fetch_all(conn, query, params):
+    with conn.cursor(cursor_factory=psycopg2.extras.DictCursor) as cursor:
+        cursor.execute(query, params)
+        return cursor.fetchall()
+
+
+def select_champions(conn):
+    return _fetch_all(conn, """
+        SELECT championid, name
+        FROM champion
+    """, {})
+
+
+def select_participants(conn, game_ids):
+    return _fetch_all(conn, """
+        SELECT participantid, gameid, teamid, statid, lane, role
+        FROM participant
+        WHERE gameid = ANY(%(game_ids)s)
+    """, {"game_ids": game_ids})
+
+
+def select_stats(conn, stat_ids):
+    return _fetch_all(conn, """
+        SELECT *
+        FROM stats
+        WHERE statid = ANY(%(stat_ids)s)
+    """, {"stat_ids": stat_ids})
+
+
+def select_frames(conn, game_ids):
+    return _fetch_all(conn, """
+        SELECT f.*, p.gameid
+        FROM participant_frame f
+        JOIN participant p ON p.participantid = f.participantid
+        WHERE p.gameid = ANY(%(game_ids)s)
+        ORDER BY p.gameid, f.timestamp, f.participantid
+    """, {"game_ids": game_ids})
+
+
+def select_kills(conn, game_ids):
+    return _fetch_all(conn, """
+        SELECT *
+        FROM kill
+        WHERE gameid = ANY(%(game_ids)s)
+        ORDER BY gameid, timestamp
+    """, {"game_ids": game_ids})
+
+
+def select_objectives(conn, game_ids):
+    return _fetch_all(conn, """
+        SELECT *
+        FROM objective
+        WHERE gameid = ANY(%(game_ids)s)
+        ORDER BY gameid, timestamp
+    """, {"game_ids": game_ids})
+
+
+def select_team_totals(conn, game_ids):
+    return _fetch_all(conn, """
+        SELECT p.gameid, p.teamid,
+               SUM(s.goldearned) AS gold,
+               SUM(s.totalminionskilled + COALESCE(s.neutralminionskilledenemyjungle, 0)
+                   + COALESCE(s.neutralminionskilledteamjungle, 0)) AS cs,
+               t.win
+        FROM participant p
+        JOIN stats s ON s.statid = p.statid
+        LEFT JOIN team t ON t.gameid = p.gameid AND t.teamid = p.teamid
+        WHERE p.gameid = ANY(%(game_ids)s)
+        GROUP BY p.gameid, p.teamid, t.win
+    """, {"game_ids": game_ids})
@@ -0,0 +1,95 @@
+""" Small in-process caches shared by all requests of a worker. """
+import threading
+import time
+from collections import OrderedDict
+
+
+class TTLCache:
+    """
+    Thread-safe LRU cache whose entries expire `ttl` seconds after they were stored.
+
+    At most `maxsize` entries are kept; the least recently used entry is evicted first. If `maxbytes` is given,
+    entries are also evicted until the sizes reported by `sizeof` add up to no more than `maxbytes`.
+    """
+
+    _MISSING = object()
+
+    def __init__(self, maxsize: int, ttl: float, maxbytes: int = None, sizeof=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.maxbytes = maxbytes
+        self.sizeof = sizeof if sizeof is not None else (lambda value: 0)
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key, self._MISSING)
+            if entry is not self._MISSING:
+                value, expires, size = entry
+                if expires > time.monotonic():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+                self._bytes -= size
+            self.misses += 1
+            return default
+
+    def set(self, key, value, ttl: float = None):
+        expires = time.monotonic() + (self.ttl if ttl is None else ttl)
+        size = self.sizeof(value)
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._bytes -= previous[2]
+            self._entries[key] = (value, expires, size)
+            self._bytes += size
+            self._evict()
+
+    def resize(self, key):
+        """ Measure an entry again after its value grew, evicting other entries if the cache is now too large. """
+        with self._lock:
+            entry = self._entries.get(key, self._MISSING)
+            if entry is self._MISSING:
+                return
+            value, expires, size = entry
+            resized = self.sizeof(value)
+            self._entries[key] = (value, expires, resized)
+            self._entries.move_to_end(key)
+            self._bytes += resized - size
+            self._evict()
+
+    def _evict(self):
+        while len(self._entries) > self.maxsize or \
+                (self.maxbytes is not None and self._bytes > self.maxbytes and len(self._entries) > 1):
+            _, evicted = self._entries.popitem(last=False)
+            self._bytes -= evicted[2]
+            self.evictions += 1
+
+    def __contains__(self, key):
+        with self._lock:
+            entry = self._entries.get(key, self._MISSING)
+            return entry is not self._MISSING and entry[1] > time.monotonic()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+                "bytes": self._bytes,
+                "maxbytes": self.maxbytes,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
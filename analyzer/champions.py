@@ -0,0 +1,56 @@
+""" In-process catalogue of champion names. """
+import os
+import threading
+import time
+from types import MappingProxyType
+
+import bundle
+import util
+
+logger = util.Logger(__name__)
+
+
+class ChampionCatalogue:
+    """
+    Immutable champion id to name mapping, shared by all requests of a worker.
+
+    The mapping is replaced as a whole on refresh, so readers never see a partially loaded catalogue. It is refreshed
+    when it is older than `refresh_interval` seconds or when an unknown champion id is looked up.
+    """
+
+    # lower bound between refreshes triggered by unknown ids, so bad ids cannot hammer the database
+    MISS_REFRESH_INTERVAL = 60
+
+    def __init__(self, refresh_interval: float):
+        self.refresh_interval = refresh_interval
+        self._champions = MappingProxyType({})
+        self._loaded_at = None
+        self._lock = threading.Lock()
+
+    def refresh(self, conn):
+        rows = bundle.select_champions(conn=conn)
+        with self._lock:
+            self._champions = MappingProxyType({row["championid"]: row["name"] for row in rows})
+            self._loaded_at = time.monotonic()
+        logger.info(f'loaded {len(rows)} champions')
+
+    def is_stale(self):
+        return self._loaded_at is None or time.monotonic() - self._loaded_at > self.refresh_interval
+
+    def get(self, conn):
+        """ Current champion mapping, refreshed first if it is stale. """
+        if self.is_stale():
+            self.refresh(conn)
+        return self._champions
+
+    def name(self, champ_id, conn):
+        """ Name of a champion, or None if the id is unknown even after a refresh. """
+        champions = self.get(conn)
+        if champ_id not in champions and time.monotonic() - self._loaded_at > self.MISS_REFRESH_INTERVAL:
+            # a new champion may have been released since the last refresh
+            self.refresh(conn)
+            champions = self._champions
+        return champions.get(champ_id)
+
+
+catalogue = ChampionCatalogue(refresh_interval=float(os.getenv('CHAMPION_REFRESH_INTERVAL', 24 * 60 * 60)))
@@ -26,6 +26,27 @@ class Map:
     HALF_DIST = 10553.64
 
 
+class Side:
+    BLUE = -1
+    NEUTRAL = 0
+    RED = 1
+
+
+class Region:
+    TOP_LANE = 0
+    MID_LANE = 1
+    BOT_LANE = 2
+    RIVER = 3
+    JUNGLE = 4
+
+
+class Together:
+    # distance up to which the duo counts as together, and the shares of time separating the duo types
+    DIST = 1000
+    LOVERS = 2 / 3
+    SINGLES = 1 / 3
+
+
 class Role:
     TOP = "TOP"
     JGL = "JUNGLE"
@@ -0,0 +1,414 @@
+""" Per-participant features of every game, computed once and shared by all metrics, classifications and models. """
+import atexit
+import io
+import json
+import multiprocessing
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import analysis
+import bundle
+import database
+import util
+
+logger = util.Logger(__name__)
+
+# bump whenever the definition of a feature changes, stored chunks of other versions are recomputed
+VERSION = 2
+
+FEATURES = (
+    "kp", "fw_kills", "positioning", "ganking", "kda", "gold_share", "cs_share",
+    "gold_diff.overall", "gold_diff.early", "gold_diff.mid", "gold_diff.late",
+    "cs_diff.overall", "cs_diff.early", "cs_diff.mid", "cs_diff.late",
+    "worthness", "objectives",
+    "kills", "deaths", "assists", "minions", "win",
+)
+KEYS = ("game_id", "participant_id", "team_id")
+PHASES = ("overall", "early", "mid", "late")
+
+
+class FeatureTable:
+    """
+    Features as one NumPy column each, one row per (game, participant), sorted by participant id.
+
+    Participant ids are unique across games, so rows are found by binary search on them. Missing features are NaN.
+    """
+
+    def __init__(self, columns: dict):
+        order = np.argsort(columns["participant_id"], kind="stable")
+        self.columns = {name: np.asarray(columns[name])[order] for name in KEYS + FEATURES}
+        self.participant_id = self.columns["participant_id"]
+        self.game_id = self.columns["game_id"]
+
+    @classmethod
+    def empty(cls):
+        columns = {name: np.empty(0, dtype=np.int64) for name in KEYS}
+        columns.update({name: np.empty(0) for name in FEATURES})
+        return cls(columns)
+
+    @classmethod
+    def from_rows(cls, rows):
+        """ Build a table from one dictionary of keys and features per row, missing features become NaN. """
+        columns = {name: np.array([row[name] for row in rows], dtype=np.int64) for name in KEYS}
+        columns.update({name: np.array([row.get(name, np.nan) for row in rows], dtype=float) for name in FEATURES})
+        return cls(columns)
+
+    @classmethod
+    def concat(cls, tables):
+        """ Rows of all tables; a participant in several tables keeps the row of the last one. """
+        tables = [table for table in tables if len(table) > 0]
+        if not tables:
+            return cls.empty()
+        participants = np.concatenate([table.participant_id for table in tables])
+        # keep the last occurrence of every participant
+        _, last = np.unique(participants[::-1], return_index=True)
+        keep = len(participants) - 1 - last
+        return cls({
+            name: np.concatenate([table.columns[name] for table in tables])[keep] for name in KEYS + FEATURES
+        })
+
+    def __len__(self):
+        return len(self.participant_id)
+
+    def game_ids(self):
+        return set(np.unique(self.game_id).tolist())
+
+    def select_games(self, game_ids):
+        """ Rows of the given games. """
+        mask = np.isin(self.game_id, np.fromiter(game_ids, dtype=np.int64))
+        return FeatureTable({name: column[mask] for name, column in self.columns.items()})
+
+    def rows(self, participant_ids):
+        """ Row index of every participant, -1 for participants without a row. """
+        participant_ids = np.asarray(participant_ids, dtype=np.int64)
+        idx = np.searchsorted(self.participant_id, participant_ids)
+        found = idx < len(self.participant_id)
+        found[found] = self.participant_id[idx[found]] == participant_ids[found]
+        return np.where(found, idx, -1)
+
+    def values(self, feature, participant_ids):
+        """ Values of a feature for the given participants in their order, NaN for participants without a row. """
+        rows = self.rows(participant_ids)
+        if len(self) == 0:
+            return np.full(len(rows), np.nan)
+        return np.where(rows >= 0, self.columns[feature][np.maximum(rows, 0)], np.nan)
+
+    def nbytes(self):
+        return sum(column.nbytes for column in self.columns.values())
+
+    def to_bytes(self):
+        buffer = io.BytesIO()
+        np.savez(buffer, metadata=np.array(json.dumps({"version": VERSION})), **self.columns)
+        return buffer.getvalue()
+
+    @classmethod
+    def from_bytes(cls, data):
+        """ Load a stored table, an empty one if it was stored by another feature version. """
+        with np.load(io.BytesIO(data), allow_pickle=False) as archive:
+            version = json.loads(str(archive["metadata"]))["version"]
+            if version != VERSION or any(name not in archive for name in KEYS + FEATURES):
+                logger.warn(f'discarding features of version {version}, current version is {VERSION}')
+                return cls.empty()
+            return cls({name: archive[name] for name in KEYS + FEATURES})
+
+
+def compute(games: bundle.CommonGamesBundle, game_ids=None) -> FeatureTable:
+    """
+    Compute the features of every participant of the given games of a bundle.
+
+    :param games: loaded games
+    :param game_ids: games to compute, defaults to all games of the bundle
+    :return: feature table of the games
+    """
+    if game_ids is None:
+        game_ids = {game["gameid"] for game in games}
+
+    rows = []
+    lanes = []
+    lane_rows = []
+    for game_id in sorted(game_ids):
+        teams = games.participant_teams(game_id)
+        frames = games.frames(game_id)
+        kills = games.kills(game_id)
+        kill_table = analysis.kills.KillTable.build(kills)
+        people = analysis.aggression.fight_sizes(frames=frames, kills=kills)
+        fights = analysis.fights.FightTable.build(
+            kills=kills,
+            objectives=games.objectives(game_id),
+            frames=frames,
+            teams=teams,
+        )
+
+        for participant_id, team_id in teams.items():
+            participant = games.participant(participant_id)
+            stats = games.stats(participant["statid"])
+            tactician = analysis.classification.tactician(participant_id, team_id, fights)
+            e_jgl = stats["neutralminionskilledenemyjungle"] if stats["neutralminionskilledenemyjungle"] is not None else 0
+            t_jgl = stats["neutralminionskilledteamjungle"] if stats["neutralminionskilledteamjungle"] is not None else 0
+            team_gold = games.team_gold(game_id=game_id, team_id=team_id)
+            team_cs = games.team_cs(game_id=game_id, team_id=team_id)
+
+            row = {
+                "game_id": game_id,
+                "participant_id": participant_id,
+                "team_id": team_id,
+                "kp": kill_table.kill_participation(participant=participant_id, team_id=team_id),
+                "fw_kills": kill_table.forward_kills(participant=participant_id, team_id=team_id),
+                "positioning": analysis.aggression.positioning(team_id=team_id, frames=frames,
+                                                               participant=participant_id),
+                "ganking": analysis.aggression.ganking(
+                    participant=participant_id,
+                    role=util.get_canonic_lane(lane=participant["lane"], role=participant["role"]),
+                    kills=kills,
+                    people=people,
+                ),
+                "kda": analysis.base_analysis.game_kda(stats),
+                "worthness": tactician["worthness"],
+                "objectives": tactician["objectives"],
+                "kills": stats["kills"],
+                "deaths": stats["deaths"],
+                "assists": stats["assists"],
+                "minions": stats["totalminionskilled"],
+            }
+            win = games.team_win(game_id=game_id, team_id=team_id)
+            if win is not None:
+                row["win"] = float(win)
+            if team_gold:
+                row["gold_share"] = analysis.base_analysis.gold_share(stats["goldearned"], team_gold=team_gold)
+            if team_cs:
+                row["cs_share"] = analysis.base_analysis.cs_share(stats["totalminionskilled"] + e_jgl + t_jgl, team_cs)
+
+            opponent = games.opponent(participant_id)
+            if opponent is not None:
+                lanes.append((frames, participant_id, opponent["participantid"]))
+                lane_rows.append(row)
+            rows.append(row)
+
+    # lane differences of all participants with an opponent in one pass
+    for name, diffs in (("gold_diff", analysis.base_analysis.gold_diffs(lanes)),
+                        ("cs_diff", analysis.base_analysis.cs_diffs(lanes))):
+        for phase in PHASES:
+            for row, diff in zip(lane_rows, diffs[phase]):
+                row[f"{name}.{phase}"] = diff
+
+    return FeatureTable.from_rows(rows)
+
+
+class FeatureStore:
+    """
+    Feature tables of all processed games, stored as append-only chunk files in one directory.
+
+    Every update writes each chunk of newly computed games to its own file, numbered in the order they were written,
+    and never rewrites a stored chunk. Workers only keep an index of the game ids of every chunk, refreshed with the
+    chunks written since at most every `check_interval` seconds; features are read from the chunks of the games a
+    request needs, or streamed one chunk at a time by population-wide reductions. Games that are not stored yet are
+    computed from their loaded bundle on demand.
+
+    Updates compute chunks of games in a pool of `workers` processes, each with its own database connection.
+    """
+
+    def __init__(self, directory, check_interval: float, chunk: int, workers: int):
+        self.directory = directory
+        self.check_interval = check_interval
+        self.chunk = chunk
+        self.workers = workers
+        # sorted game ids of all stored chunks and the chunk of each game, merged with the pending ones on lookup
+        self._game_ids = np.empty(0, dtype=np.int64)
+        self._game_chunks = np.empty(0, dtype=np.int64)
+        self._pending = []
+        self._participants = 0
+        self._last_chunk = -1
+        self._checked_at = None
+        self._lock = threading.Lock()
+        self._update_lock = threading.Lock()
+
+    def select_games(self, game_ids) -> FeatureTable:
+        """ Stored rows of the given games, read from the chunks holding them. """
+        game_ids = np.fromiter(game_ids, dtype=np.int64)
+        chunks = np.unique(self._chunks_of(game_ids))
+        return FeatureTable.concat([self._read(chunk).select_games(game_ids) for chunk in chunks[chunks >= 0].tolist()])
+
+    def table_for(self, games: bundle.CommonGamesBundle) -> FeatureTable:
+        """ Features of all games of a bundle, computing the games that are not stored yet. """
+        game_ids = {game["gameid"] for game in games}
+        stored = self.select_games(game_ids)
+        missing = game_ids - stored.game_ids()
+        if not missing:
+            return stored
+        return FeatureTable.concat([stored, compute(games, missing)])
+
+    def chunks(self, after: int = -1):
+        """
+        Stream the stored chunks written after chunk `after`, one table at a time.
+
+        :param after: number of the last chunk not to read, -1 for all chunks
+        :return: iterator over (chunk number, feature table), in the order the chunks were written
+        """
+        self._refresh(force=True)
+        for chunk in range(after + 1, self._last_chunk + 1):
+            table = self._read(chunk)
+            if table is not None:
+                yield chunk, table
+
+    def update(self, conn, job, games=None) -> int:
+        """
+        Compute and store the features of all games that are not stored yet. Runs as part of a background job.
+
+        Games are loaded `chunk` at a time with the set-based queries of `bundle`, spread over the worker processes.
+        Chunks are stored in the order of `games` whatever order they finish in, so the stored rows do not depend on
+        the number of workers. Each chunk is stored as soon as it is computed, so an interrupted update keeps all
+        finished chunks.
+
+        :param conn: database connection
+        :param job: job to report the progress to
+        :param games: game rows to make sure of with the rows of a game adjacent, defaults to streaming all games
+        :return: number of the last stored chunk, -1 if there is none
+        """
+        if games is None:
+            games = bundle.iter_all_games(conn=conn)
+        # one update at a time, a concurrent one finds the games of the first one stored
+        with self._update_lock:
+            self._refresh(force=True)
+            new = (
+                game
+                for candidates in bundle.game_chunks(games, self.chunk)
+                for game, chunk in zip(candidates, self._chunks_of([game["gameid"] for game in candidates]))
+                if chunk < 0
+            )
+
+            processed = 0
+            job.update(processed=processed)
+            for table in self._compute(conn, bundle.game_chunks(new, self.chunk)):
+                self._write(table)
+                processed += len(table.game_ids())
+                job.update(processed=processed)
+            return self._last_chunk
+
+    def stats(self):
+        self._refresh()
+        with self._lock:
+            return {
+                "version": VERSION,
+                "chunks": self._last_chunk + 1,
+                "games": len(self._game_ids) + sum(len(game_ids) for game_ids, _ in self._pending),
+                "participants": self._participants,
+                "index_bytes": self._game_ids.nbytes + self._game_chunks.nbytes,
+                "workers": self.workers,
+            }
+
+    def _compute(self, conn, chunks):
+        """
+        Feature tables of a stream of chunks of game rows, in the order of the chunks.
+
+        At most two chunks per worker process are submitted ahead, so the stream is not read faster than it is
+        computed.
+        """
+        if self.workers <= 1:
+            for chunk in chunks:
+                yield compute(bundle.load_games(conn=conn, games=chunk))
+            return
+
+        logger.info(f'computing features in {self.workers} processes')
+        # spawn instead of fork, the job runs in a thread of a multi-threaded worker
+        with ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context('spawn'),
+                                 initializer=_init_worker) as executor:
+            pending = deque()
+            for chunk in chunks:
+                pending.append(executor.submit(_compute_chunk, chunk))
+                if len(pending) >= 2 * self.workers:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+
+    def _path(self, chunk):
+        return os.path.join(self.directory, f'{chunk:08d}.npz')
+
+    def _read(self, chunk):
+        """ Table of a stored chunk, None if it was stored by another feature version. """
+        with open(self._path(chunk), 'rb') as file:
+            table = FeatureTable.from_bytes(file.read())
+        return table if len(table) > 0 else None
+
+    def _write(self, table: FeatureTable):
+        """ Store a table as the next chunk, without ever replacing a stored chunk. """
+        os.makedirs(self.directory, exist_ok=True)
+        tmp_path = os.path.join(self.directory, f'.{os.getpid()}.{threading.get_ident()}.tmp')
+        with open(tmp_path, 'wb') as file:
+            file.write(table.to_bytes())
+            file.flush()
+            os.fsync(file.fileno())
+        try:
+            while True:
+                self._refresh(force=True)
+                try:
+                    # a link fails if another process took the number first, then try the next one
+                    os.link(tmp_path, self._path(self._last_chunk + 1))
+                    break
+                except FileExistsError:
+                    continue
+        finally:
+            os.remove(tmp_path)
+        self._refresh(force=True)
+        logger.info(f'stored features of {len(table.game_ids())} games as chunk {self._last_chunk}')
+
+    def _chunks_of(self, game_ids):
+        """ Chunk of every game, -1 for games that are not stored. """
+        self._refresh()
+        game_ids = np.asarray(game_ids, dtype=np.int64)
+        with self._lock:
+            if self._pending:
+                ids = np.concatenate([self._game_ids] + [game_ids for game_ids, _ in self._pending])
+                chunks = np.concatenate([self._game_chunks] + [chunks for _, chunks in self._pending])
+                order = np.argsort(ids, kind="stable")
+                self._game_ids, self._game_chunks = ids[order], chunks[order]
+                self._pending = []
+            if len(self._game_ids) == 0:
+                return np.full(len(game_ids), -1, dtype=np.int64)
+            idx = np.minimum(np.searchsorted(self._game_ids, game_ids), len(self._game_ids) - 1)
+            return np.where(self._game_ids[idx] == game_ids, self._game_chunks[idx], -1)
+
+    def _refresh(self, force=False):
+        """ Add the game ids of the chunks written since the last refresh to the index. """
+        now = time.monotonic()
+        if not force and self._checked_at is not None and now - self._checked_at < self.check_interval:
+            return
+        with self._lock:
+            self._checked_at = now
+            chunk = self._last_chunk + 1
+            while os.path.exists(self._path(chunk)):
+                with np.load(self._path(chunk), allow_pickle=False) as archive:
+                    version = json.loads(str(archive["metadata"]))["version"]
+                    game_ids = archive["game_id"] if version == VERSION else np.empty(0, dtype=np.int64)
+                if len(game_ids) > 0:
+                    unique = np.unique(game_ids)
+                    self._pending.append((unique, np.full(len(unique), chunk, dtype=np.int64)))
+                    self._participants += len(game_ids)
+                self._last_chunk = chunk
+                chunk += 1
+
+
+# database connection of a process of the feature pool
+_worker_conn = None
+
+
+def _init_worker():
+    global _worker_conn
+    _worker_conn = database.get_connection()
+    atexit.register(database.kill_connection, _worker_conn)
+
+
+def _compute_chunk(games):
+    return compute(bundle.load_games(conn=_worker_conn, games=games))
+
+
+store = FeatureStore(
+    directory=os.getenv('FEATURES_DIR', '/analyzer/features'),
+    check_interval=float(os.getenv('FEATURES_CHECK_INTERVAL', 5)),
+    chunk=int(os.getenv('FEATURES_CHUNK', 200)),
+    workers=int(os.getenv('FEATURES_WORKERS', 1)),
+)
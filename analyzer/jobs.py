@@ -0,0 +1,137 @@
+""" Background jobs of a worker, used to retrain models off the request path. """
+import threading
+import time
+import traceback
+import uuid
+from collections import OrderedDict
+
+import util
+
+logger = util.Logger(__name__)
+
+
+class JobConflict(Exception):
+    def __init__(self, job):
+        super().__init__(f'{job.name} job {job.id} is still {job.state}')
+        self.job = job
+
+
+class Job:
+    """ State and progress of one background job. Counters are updated by the job while it runs. """
+
+    QUEUED = "queued"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+
+    def __init__(self, name):
+        self.id = uuid.uuid4().hex
+        self.name = name
+        self.state = self.QUEUED
+        self.processed = 0
+        self.total = None
+        self.counts = {}
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self._lock = threading.Lock()
+
+    def update(self, processed=None, total=None, **counts):
+        """ Report progress, e.g. `job.update(processed=10, total=100, samples=7)`. """
+        with self._lock:
+            if processed is not None:
+                self.processed = processed
+            if total is not None:
+                self.total = total
+            self.counts.update(counts)
+
+    @property
+    def active(self):
+        return self.state in (self.QUEUED, self.RUNNING)
+
+    def to_dict(self):
+        with self._lock:
+            return {
+                "id": self.id,
+                "name": self.name,
+                "state": self.state,
+                "processed": self.processed,
+                "total": self.total,
+                "counts": dict(self.counts),
+                "result": self.result,
+                "error": self.error,
+                "created_at": self.created_at,
+                "started_at": self.started_at,
+                "finished_at": self.finished_at,
+            }
+
+
+class JobRunner:
+    """
+    Runs jobs in daemon threads of the worker, at most one active job per name.
+
+    Each job gets its own connection from the pool for its whole run. The last `history` jobs are kept for polling.
+
+    Jobs, the one-active-job-per-name guard and the lookup for /jobs/{job_id} live in this process only. This relies on
+    the image running a single gunicorn worker; with more workers a second job could start in another worker and
+    polling would only find jobs that happen to land on the same worker.
+    """
+
+    def __init__(self, pool, history: int = 50):
+        self.pool = pool
+        self.history = history
+        self._jobs = OrderedDict()
+        self._active = {}
+        self._lock = threading.Lock()
+
+    def start(self, name, target) -> Job:
+        """
+        Start `target(conn, job)` in the background unless a job of the same name is still active.
+
+        :param name: job name, e.g. the model being retrained
+        :param target: callable doing the work, its return value becomes the job result
+        :return: the started job
+        :raises JobConflict: if a job of the same name is queued or running
+        """
+        with self._lock:
+            active = self._active.get(name)
+            if active is not None and active.active:
+                raise JobConflict(active)
+            job = Job(name)
+            self._active[name] = job
+            self._jobs[job.id] = job
+            while len(self._jobs) > self.history:
+                oldest = next(iter(self._jobs.values()))
+                if oldest.active:
+                    break
+                self._jobs.popitem(last=False)
+
+        logger.info(f'starting {name} job {job.id}')
+        threading.Thread(target=self._run, args=(job, target), name=f'job-{name}-{job.id[:8]}', daemon=True).start()
+        return job
+
+    def get(self, job_id):
+        return self._jobs.get(job_id)
+
+    def latest(self, name):
+        return self._active.get(name)
+
+    def _run(self, job, target):
+        job.state = Job.RUNNING
+        job.started_at = time.time()
+        try:
+            conn = self.pool.get()
+            try:
+                job.result = target(conn, job)
+            finally:
+                self.pool.put(conn)
+            job.state = Job.DONE
+            logger.info(f'{job.name} job {job.id} done')
+        except Exception as e:
+            job.error = str(e)
+            job.state = Job.FAILED
+            logger.error(f'{job.name} job {job.id} failed: {traceback.format_exc()}')
+        finally:
+            job.finished_at = time.time()
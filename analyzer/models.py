@@ -0,0 +1,163 @@
+""" In-process registry of the trained classification models. """
+import hashlib
+import io
+import json
+import os
+import threading
+import time
+
+import numpy as np
+
+import util
+
+logger = util.Logger(__name__)
+
+
+class ModelUnavailable(LookupError):
+    pass
+
+
+class CentroidModel:
+    """
+    Nearest-centre predictor exported from a trained KMeans model.
+
+    Stored as a small .npz archive holding the cluster centres and a JSON metadata string, so serving neither needs
+    scikit-learn nor unpickles anything. Predictions are identical to `KMeans.predict`.
+    """
+
+    def __init__(self, centres, metadata: dict):
+        self.cluster_centers_ = np.asarray(centres, dtype=float)
+        self.metadata = metadata
+
+    @classmethod
+    def from_kmeans(cls, kmeans, **metadata):
+        """ Export a fitted `sklearn.cluster.KMeans`, adding its training parameters to the metadata. """
+        return cls(kmeans.cluster_centers_, dict(
+            metadata,
+            n_clusters=int(kmeans.n_clusters),
+            n_features=int(kmeans.cluster_centers_.shape[1]),
+            inertia=float(kmeans.inertia_),
+            n_iter=int(kmeans.n_iter_),
+            trained_at=time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        ))
+
+    @classmethod
+    def from_bytes(cls, data):
+        with np.load(io.BytesIO(data), allow_pickle=False) as archive:
+            return cls(archive["centres"], json.loads(str(archive["metadata"])))
+
+    def to_bytes(self):
+        buffer = io.BytesIO()
+        np.savez(buffer, centres=self.cluster_centers_, metadata=np.array(json.dumps(self.metadata, sort_keys=True)))
+        return buffer.getvalue()
+
+    def predict(self, values):
+        """ Index of the closest cluster centre of every row of `values`, the first one on ties. """
+        values = np.asarray(values, dtype=float)
+        if values.ndim != 2 or values.shape[1] != self.cluster_centers_.shape[1]:
+            raise ValueError(f'expected rows of {self.cluster_centers_.shape[1]} features, got shape {values.shape}')
+        if not np.isfinite(values).all():
+            raise ValueError('input contains NaN or infinity')
+        distances = ((values[:, np.newaxis, :] - self.cluster_centers_[np.newaxis, :, :]) ** 2).sum(axis=2)
+        return np.argmin(distances, axis=1)
+
+
+class LoadedModel:
+    """ A trained model together with the version id of the file it was loaded from. """
+
+    def __init__(self, model, version, signature):
+        self.model = model
+        self.version = version
+        self.signature = signature
+
+
+class ModelRegistry:
+    """
+    Trained models shared by all requests of a worker.
+
+    A model is loaded once and replaced as a whole when its file changes on disk, which is checked at most every
+    `check_interval` seconds, or when a retrain publishes a new one. The version id is derived from the file
+    content, so all workers report the same version for the same model.
+    """
+
+    def __init__(self, directory, names, check_interval: float):
+        self.directory = directory
+        self.names = names
+        self.check_interval = check_interval
+        self._models = {}
+        self._checked_at = {}
+        self._lock = threading.Lock()
+
+    def path(self, name):
+        return os.path.join(self.directory, f'kmeans_{name}.npz')
+
+    def load_all(self):
+        """ Load every model that has a file, logging the ones that do not. """
+        for name in self.names:
+            try:
+                self.get(name)
+            except ModelUnavailable:
+                logger.warn(f'no {name} model at {self.path(name)}')
+
+    def get(self, name) -> LoadedModel:
+        """ Current model `name`, reloaded first if its file changed. """
+        loaded = self._models.get(name)
+        now = time.monotonic()
+        if loaded is not None and now - self._checked_at.get(name, 0) < self.check_interval:
+            return loaded
+
+        with self._lock:
+            self._checked_at[name] = now
+            try:
+                signature = self._signature(name)
+            except FileNotFoundError:
+                if loaded is not None:
+                    return loaded
+                raise ModelUnavailable(name)
+            loaded = self._models.get(name)
+            if loaded is None or loaded.signature != signature:
+                loaded = self._load(name)
+                self._models[name] = loaded
+                logger.info(f'loaded {name} model version {loaded.version}')
+            return loaded
+
+    def publish(self, name, model: CentroidModel) -> LoadedModel:
+        """ Store a retrained model atomically and serve it right away. """
+        data = model.to_bytes()
+        tmp_path = f'{self.path(name)}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(tmp_path, 'wb') as file:
+            file.write(data)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(tmp_path, self.path(name))
+
+        with self._lock:
+            loaded = LoadedModel(model, _version(data), self._signature(name))
+            self._models[name] = loaded
+            self._checked_at[name] = time.monotonic()
+        logger.info(f'published {name} model version {loaded.version}')
+        return loaded
+
+    def versions(self):
+        return {name: loaded.version for name, loaded in self._models.items()}
+
+    def _signature(self, name):
+        stat = os.stat(self.path(name))
+        return stat.st_mtime_ns, stat.st_size
+
+    def _load(self, name):
+        signature = self._signature(name)
+        with open(self.path(name), 'rb') as file:
+            data = file.read()
+        return LoadedModel(CentroidModel.from_bytes(data), _version(data), signature)
+
+
+def _version(data):
+    return hashlib.sha1(data).hexdigest()[:12]
+
+
+registry = ModelRegistry(
+    directory=os.getenv('MODEL_DIR', '/analyzer'),
+    names=('millionaire', 'murderous', 'farmers', 'tactician'),
+    check_interval=float(os.getenv('MODEL_CHECK_INTERVAL', 5)),
+)
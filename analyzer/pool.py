@@ -0,0 +1,145 @@
+""" Pool of database connections shared by all requests of a worker. """
+import os
+import threading
+import time
+
+import falcon
+
+import database
+import util
+
+logger = util.Logger(__name__)
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+class ConnectionPool:
+    """
+    Bounded pool of database connections.
+
+    Connections are opened lazily up to `size`. If every connection is checked out, `get` waits up to `timeout`
+    seconds for one to be returned before raising PoolTimeout.
+    """
+
+    def __init__(self, size: int, timeout: float):
+        self.size = size
+        self.timeout = timeout
+        self._idle = []
+        self._opened = 0
+        self._cond = threading.Condition()
+        self._stats = {"checkouts": 0, "waits": 0, "timeouts": 0, "discarded": 0}
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            size=int(os.getenv('DBPOOL_SIZE', 4)),
+            timeout=float(os.getenv('DBPOOL_TIMEOUT', 10)),
+        )
+
+    def get(self):
+        deadline = time.monotonic() + self.timeout
+        with self._cond:
+            if not self._idle and self._opened >= self.size:
+                # one wait per blocked checkout, however often it is woken up
+                self._stats["waits"] += 1
+            while not self._idle and self._opened >= self.size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._stats["timeouts"] += 1
+                    raise PoolTimeout(f'no database connection available after {self.timeout}s')
+                self._cond.wait(remaining)
+            self._stats["checkouts"] += 1
+            if self._idle:
+                return self._idle.pop()
+            self._opened += 1
+
+        try:
+            return database.get_connection()
+        except Exception:
+            with self._cond:
+                self._opened -= 1
+                self._cond.notify()
+            raise
+
+    def put(self, conn):
+        healthy = not conn.closed
+        if healthy:
+            try:
+                # never hand out a connection with a transaction left open by the previous request
+                conn.rollback()
+            except Exception:
+                healthy = False
+
+        with self._cond:
+            if healthy:
+                self._idle.append(conn)
+            else:
+                self._opened -= 1
+                self._stats["discarded"] += 1
+            self._cond.notify()
+
+        if not healthy:
+            logger.warn('discarded broken database connection')
+
+    def close(self):
+        with self._cond:
+            idle, self._idle = self._idle, []
+            self._opened -= len(idle)
+        for conn in idle:
+            database.kill_connection(conn)
+
+    def stats(self):
+        with self._cond:
+            return {
+                "size": self.size,
+                "timeout": self.timeout,
+                "opened": self._opened,
+                "idle": len(self._idle),
+                "in_use": self._opened - len(self._idle),
+                **self._stats,
+            }
+
+
+class ConnectionContext(falcon.Context):
+    """
+    Request context that checks a connection out of the pool on the first use of `conn`.
+
+    Requests that never touch the database, such as /health/* and CORS preflights, do not wait for the pool.
+    """
+
+    pool = None
+    _conn = None
+
+    @property
+    def conn(self):
+        if self._conn is None:
+            try:
+                self._conn = self.pool.get()
+            except PoolTimeout as e:
+                logger.error(str(e))
+                raise falcon.HTTPServiceUnavailable(description=str(e))
+        return self._conn
+
+    def release(self):
+        conn, self._conn = self._conn, None
+        if conn is not None:
+            self.pool.put(conn)
+
+
+class PooledRequest(falcon.Request):
+    context_type = ConnectionContext
+
+
+class ConnectionMiddleware:
+    """ Give every request access to the pool and always return a checked out connection afterwards. """
+
+    def __init__(self, pool: ConnectionPool):
+        self.pool = pool
+
+    def process_request(self, req, resp):
+        req.context.pool = self.pool
+
+    def process_response(self, req, resp, resource, req_succeeded):
+        req.context.release()
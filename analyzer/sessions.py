@@ -0,0 +1,97 @@
+""" Share the data loaded for a summoner pair across the endpoints of one duo page. """
+import os
+import threading
+
+import numpy as np
+
+import analysis
+import bundle
+import database
+import features
+import model
+import summoners
+from cache import TTLCache
+
+
+class DuoSession:
+    """
+    Common games of a summoner pair plus intermediate results computed from them.
+
+    A session is only valid for the set of common games it was loaded for, which is why it is cached under the
+    newest common game id. `on_grow` is called whenever a result is stored, so a cache can measure the session again.
+    """
+
+    def __init__(self, games: bundle.CommonGamesBundle, on_grow=None):
+        self.games = games
+        self.on_grow = on_grow
+        self._results = {}
+        self._lock = threading.Lock()
+
+    def memo(self, key, compute):
+        """ Return the result stored under `key`, computing and storing it first if necessary. """
+        with self._lock:
+            if key in self._results:
+                return self._results[key]
+        result = compute()
+        with self._lock:
+            stored = key not in self._results
+            result = self._results.setdefault(key, result)
+        if stored and self.on_grow is not None:
+            self.on_grow()
+        return result
+
+    def features(self):
+        """ Features of all participants of the common games, see `features.FeatureTable`. """
+        return self.memo("features", lambda: features.store.table_for(self.games))
+
+    def time_together(self, thresholds):
+        """ Shares of time the duo spent together in every common game, per distance threshold. """
+        return self.memo(("time_together", tuple(thresholds)), lambda: analysis.classification.time_together(
+            [(self.games.frames(game["gameid"]), game["s1_participantid"], game["s2_participantid"])
+             for game in self.games],
+            thresholds,
+        ))
+
+    def approximate_size(self):
+        """ Size of the loaded games plus all stored results. """
+        with self._lock:
+            results = list(self._results.values())
+        return self.games.approximate_size() + sum(_nbytes(result) for result in results)
+
+
+def _nbytes(result):
+    if isinstance(result, np.ndarray):
+        return result.nbytes
+    if isinstance(result, dict):
+        return sum(_nbytes(value) for value in result.values())
+    if hasattr(result, 'nbytes'):
+        return result.nbytes()
+    return 0
+
+
+cache = TTLCache(
+    maxsize=int(os.getenv('SESSION_CACHE_SIZE', 64)),
+    ttl=float(os.getenv('SESSION_CACHE_TTL', 120)),
+    maxbytes=int(os.getenv('SESSION_CACHE_BYTES', 256 * 1024 * 1024)),
+    sizeof=DuoSession.approximate_size,
+)
+
+
+def load(conn, s1: model.Summoner, s2: model.Summoner) -> DuoSession:
+    """
+    Load the session of summoner 1 and 2, reusing a cached one as long as no new common game was played.
+
+    :param conn: database connection
+    :param s1: summoner 1
+    :param s2: summoner 2
+    :return: duo session
+    """
+    games = database.select_common_games(conn=conn, s1=s1, s2=s2)
+    newest = max((game["gameid"] for game in games), default=None)
+    key = (summoners.normalize_name(s1.name), summoners.normalize_name(s2.name), newest)
+
+    session = cache.get(key)
+    if session is None:
+        session = DuoSession(bundle.load_games(conn=conn, games=games), on_grow=lambda: cache.resize(key))
+        cache.set(key, session)
+    return session
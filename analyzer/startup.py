@@ -0,0 +1,85 @@
+"""
+Boot time bookkeeping: import times per package and an optional warm-up of lazily imported modules.
+
+Only the standard library is imported here, so the timer sees every import of the app.
+"""
+import importlib
+import os
+import sys
+import time
+from collections import defaultdict
+
+# heavy modules only some endpoints need, imported on first use unless the worker is warmed up
+DEFERRED = ('scipy.special', 'sklearn.cluster')
+
+
+class ImportTimer:
+    """
+    Meta path hook measuring how long modules take to execute while it is active.
+
+    The time of a module excludes the modules it imports itself and is attributed to its top-level package, like
+    `python -X importtime` but available in the boot log.
+    """
+
+    def __init__(self):
+        self.packages = defaultdict(float)
+        self.total = 0
+        self._stack = []
+        self._active = False
+        self._started = None
+
+    def __enter__(self):
+        self._active = True
+        self._started = time.perf_counter()
+        sys.meta_path.insert(0, self)
+        return self
+
+    def __exit__(self, *exc_info):
+        sys.meta_path.remove(self)
+        self._active = False
+        self.total += time.perf_counter() - self._started
+
+    def find_spec(self, fullname, path, target=None):
+        for finder in sys.meta_path:
+            if finder is self or not hasattr(finder, 'find_spec'):
+                continue
+            spec = finder.find_spec(fullname, path, target)
+            if spec is None:
+                continue
+            # file loaders are created per module, builtin and frozen importers are shared classes
+            if spec.loader is not None and not isinstance(spec.loader, type) and hasattr(spec.loader, 'exec_module'):
+                spec.loader.exec_module = self._timed(fullname, spec.loader.exec_module)
+            return spec
+        return None
+
+    def _timed(self, fullname, exec_module):
+        def timed_exec_module(module):
+            if not self._active:
+                return exec_module(module)
+            self._stack.append(0.0)
+            started = time.perf_counter()
+            try:
+                return exec_module(module)
+            finally:
+                elapsed = time.perf_counter() - started
+                self.packages[fullname.partition('.')[0]] += elapsed - self._stack.pop()
+                if self._stack:
+                    self._stack[-1] += elapsed
+        return timed_exec_module
+
+    def report(self, top=8):
+        """ One line summary of the total import time and the slowest packages. """
+        slowest = sorted(self.packages.items(), key=lambda item: item[1], reverse=True)[:top]
+        breakdown = ', '.join(f'{package} {seconds * 1000:.0f} ms' for package, seconds in slowest)
+        return f'imports took {self.total * 1000:.0f} ms ({breakdown})'
+
+
+def warm_up(timer: ImportTimer):
+    """ Import the deferred modules now instead of in the first request that needs them. """
+    with timer:
+        for name in DEFERRED:
+            importlib.import_module(name)
+
+
+def warm_up_enabled():
+    return os.getenv('WARM_UP', '0').lower() in ('1', 'true', 'yes')
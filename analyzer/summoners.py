@@ -0,0 +1,46 @@
+""" Cached summoner name resolution. """
+import os
+
+import database
+import model
+from cache import TTLCache
+
+_MISSING = object()
+
+cache = TTLCache(
+    maxsize=int(os.getenv('SUMMONER_CACHE_SIZE', 4096)),
+    ttl=float(os.getenv('SUMMONER_CACHE_TTL', 300)),
+)
+# unknown names are remembered for a shorter time, so new summoners show up quickly
+unknown = TTLCache(
+    maxsize=int(os.getenv('SUMMONER_CACHE_SIZE', 4096)),
+    ttl=float(os.getenv('SUMMONER_CACHE_NEGATIVE_TTL', 30)),
+)
+
+
+def normalize_name(summoner_name: str) -> str:
+    """ Summoner names are unique regardless of case and whitespace. """
+    return ''.join(summoner_name.split()).lower()
+
+
+def resolve(conn, summoner_name: str) -> model.Summoner:
+    """
+    Look up a summoner by name, serving repeated lookups from the cache.
+
+    :param conn: database connection
+    :param summoner_name: name as entered by the user
+    :return: summoner or None if no summoner has this name
+    """
+    # both caches are keyed on the name as queried, the database decides which spellings match a summoner
+    summoner = cache.get(summoner_name, _MISSING)
+    if summoner is not _MISSING:
+        return summoner
+    if unknown.get(summoner_name, _MISSING) is not _MISSING:
+        return None
+
+    summoner = database.select_summoner(conn=conn, summoner_name=summoner_name)
+    if summoner is None:
+        unknown.set(summoner_name, None)
+    else:
+        cache.set(summoner_name, summoner)
+    return summoner
@@ -1,9 +1,12 @@
 import json
 
+import falcon
 import numpy as np
 
+import aggregates
 import analysis
-import database
+import bundle
+import jobs
 import util
 
 logger = util.Logger(__name__)
@@ -12,167 +15,94 @@ logger = util.Logger(__name__)
 class AverageAggression:
     def on_get(self, req, resp):
         logger.info("GET /average/aggression")
-        conn = database.get_connection()
-        games = database.select_all_games(conn=conn)
+        population = aggregates.store.get()
 
         stats = {
-            "kp": [], "fw_kills": [], "positioning": [], "ganking": [], "aggression": 0
+            "kp": population.mean("kp"),
+            "fw_kills": population.mean("fw_kills"),
+            "positioning": population.mean("positioning"),
+            "ganking": population.mean("ganking"),
         }
-
-        for game in games:
-            team_kills = database.select_kill_timeline(conn=conn, game_id=game["gameid"], team_id=game["s1_teamid"])
-            p1_frames = database.select_participant_frames(conn=conn, participant_id=game["s1_participantid"])
-            frames = database.select_game_frames(conn=conn, game_id=game["gameid"])
-            kills = database.select_all_kill_timeline(conn=conn, game_id=game["gameid"])
-
-            # Kill Participation
-            stats["kp"].append(analysis.base_analysis.kill_participation(
-                participant=game["s1_participantid"],
-                kills=team_kills,
-            ))
-            stats["fw_kills"].append(analysis.aggression.forward_kills(
-                participant=game["s1_participantid"],
-                kills=team_kills
-            ))
-            stats["positioning"].append(analysis.aggression.positioning(
-                team_id=game["s1_teamid"],
-                frames=p1_frames
-            ))
-            stats["ganking"].append(analysis.aggression.ganking(
-                participant=game["s1_participantid"],
-                role=util.get_canonic_lane(lane=game["s1_lane"], role=game["s1_role"]),
-                frames=frames,
-                kills=kills
-            ))
-
-        stats["kp"] = np.nanmean(np.array(stats["kp"]))
-        stats["fw_kills"] = np.nanmean(np.array(stats["fw_kills"]))
-        stats["positioning"] = np.nanmean(np.array(stats["positioning"]))
-        stats["ganking"] = np.nanmean(np.array(stats["ganking"]))
-
-        stats["aggression"] = analysis.aggression.aggression(stats["kp"], stats["fw_kills"], stats["positioning"],
-                                                             stats["ganking"])
+        stats["aggression"] = float(analysis.aggression.aggression(
+            stats["kp"], stats["fw_kills"], stats["positioning"], stats["ganking"]))
 
         resp.body = json.dumps(stats)
 
 
 class AverageBasics:
     def on_get(self, req, resp):
-        logger.info("GET /average/aggression")
-        conn = database.get_connection()
-        games = database.select_all_games(conn=conn)
-
-        wr = analysis.base_analysis.win_rate(games)
-
-        kda = {"kills": 0, "deaths": 0, "assists": 0}
-        cs = 0
-        gold_diff = {"overall": [], "early": [], "mid": [], "late": []}
-
-        for game in games:
-            stats = database.select_stats(conn=conn, statid=game["s1_statid"])
-            kda["kills"] += stats.kills
-            kda["deaths"] += stats.deaths
-            kda["assists"] += stats.assists
-
-            cs += stats.total_minions_killed
-
-            p1_frames = database.select_participant_frames(conn=conn, participant_id=game["s1_participantid"])
-            p1_opponent = database.select_opponent(
-                conn=conn,
-                participant_id=game["s1_participantid"],
-                game_id=game["gameid"],
-                position=(game["s1_lane"], game["s1_role"])
-            )
-            if p1_opponent is not None:
-                p1_opponent_frames = database.select_participant_frames(conn=conn,
-                                                                        participant_id=p1_opponent.participant_id)
-                if len(p1_opponent_frames) > 0:
-                    p1_gold_diff = analysis.base_analysis.gold_diff(frames=p1_frames,
-                                                                    opponent_frames=p1_opponent_frames)
-                    gold_diff["overall"].append(p1_gold_diff["overall"])
-                    gold_diff["early"].append(p1_gold_diff["early"])
-                    gold_diff["mid"].append(p1_gold_diff["mid"])
-                    gold_diff["late"].append(p1_gold_diff["late"])
-
-        gold_diff["overall"] = np.nanmean(np.array(gold_diff["overall"]))
-        gold_diff["early"] = np.nanmean(np.array(gold_diff["early"]))
-        gold_diff["mid"] = np.nanmean(np.array(gold_diff["mid"]))
-        gold_diff["late"] = np.nanmean(np.array(gold_diff["late"]))
+        logger.info("GET /average/basics")
+        population = aggregates.store.get()
+        counts = population.counts
 
         resp.body = json.dumps({
-            "win_rate": wr,
-            "kda": analysis.base_analysis.avg_kda(kda["kills"], kda["deaths"], kda["assists"]),
-            "cs": cs / len(games),
-            "gold_diff": gold_diff,
+            "win_rate": counts["wins"] / counts["games"] if counts["games"] > 0 else np.inf,
+            "kda": analysis.base_analysis.avg_kda(counts["kills"], counts["deaths"], counts["assists"]),
+            "cs": counts["minions"] / counts["games"] if counts["games"] > 0 else np.nan,
+            "gold_diff": {phase: population.mean(f"gold_diff.{phase}") for phase in ("overall", "early", "mid", "late")},
         })
 
 
 class AverageWinRate:
     def on_get(self, req, resp):
-        """Calculates classification model for Millionaire class."""
+        """Average win rate of all summoners with at least `min_games` games."""
         logger.info("GET /average/win-rate")
-        conn = database.get_connection()
-
-        summoners = database.select_all_summoners(conn=conn)
-        rates = []
+        conn = req.context.conn
+        min_games = req.get_param_as_int("min_games", min_value=1, default=3)
 
-        for summoner in summoners:
-            games = database.select_summoner_games(conn=conn, account_id=summoner["accountid"])
-            if len(games) > 2:
-                wr = analysis.base_analysis.win_rate(games)
-                rates.append(wr)
+        # wr is null if no summoner has enough games
+        average = bundle.select_average_win_rate(conn=conn, min_games=min_games)
 
         resp.body = json.dumps({
-            "wr": np.nanmean(rates)
+            "wr": average["wr"],
+            "summoners": average["summoners"],
+            "min_games": min_games,
         })
 
 
 class AverageCs:
     def on_get(self, req, resp):
-        logger.info("GET /average/aggression")
-        conn = database.get_connection()
-        games = database.select_all_games(conn=conn)
-
-        shares = []
-        cs_diff = {"overall": [], "early": [], "mid": [], "late": []}
-
-        for game in games:
-            stats = database.select_stats(conn=conn, statid=game["s1_statid"])
-            team_cs = database.select_team_cs(conn=conn, team_id=game["s1_teamid"], game_id=game["gameid"])
-
-            e_jgl = stats.neutral_minions_killed_enemy_jungle if stats.neutral_minions_killed_enemy_jungle is not None else 0
-            t_jgl = stats.neutral_minions_killed_team_jungle if stats.neutral_minions_killed_team_jungle is not None else 0
-
-            cs = stats.total_minions_killed + e_jgl + t_jgl
-            if team_cs[0]["cs"] is None:
-                continue
-            cs_share = analysis.base_analysis.cs_share(cs, team_cs[0]["cs"])
-            shares.append(cs_share)
-
-            p1_frames = database.select_participant_frames(conn=conn, participant_id=game["s1_participantid"])
-            p1_opponent = database.select_opponent(
-                conn=conn,
-                participant_id=game["s1_participantid"],
-                game_id=game["gameid"],
-                position=(game["s1_lane"], game["s1_role"])
-            )
-            if p1_opponent is not None:
-                p1_opponent_frames = database.select_participant_frames(conn=conn,
-                                                                        participant_id=p1_opponent.participant_id)
-                if len(p1_opponent_frames) > 0:
-                    p1_cs_diff = analysis.base_analysis.cs_diff(frames=p1_frames,
-                                                                opponent_frames=p1_opponent_frames)
-                    cs_diff["overall"].append(p1_cs_diff["overall"])
-                    cs_diff["early"].append(p1_cs_diff["early"])
-                    cs_diff["mid"].append(p1_cs_diff["mid"])
-                    cs_diff["late"].append(p1_cs_diff["late"])
+        logger.info("GET /average/cs")
+        population = aggregates.store.get()
 
         resp.body = json.dumps({
-            "cs_share": np.nanmean(shares),
-            "cs_diff": {
-                "overall": np.nanmean(cs_diff["overall"]),
-                "early": np.nanmean(cs_diff["early"]),
-                "mid": np.nanmean(cs_diff["mid"]),
-                "late": np.nanmean(cs_diff["late"]),
-            }
+            "cs_share": population.mean("cs_share"),
+            "cs_diff": {phase: population.mean(f"cs_diff.{phase}") for phase in ("overall", "early", "mid", "late")},
         })
+
+
+class AverageUpdate:
+    """ Adds new games to the population aggregates in a background job on POST, reports their state on GET. """
+
+    name = 'aggregates'
+
+    def __init__(self, runner: jobs.JobRunner):
+        self.runner = runner
+
+    def on_get(self, req, resp):
+        logger.info("GET /average/update")
+        latest = self.runner.latest(self.name)
+        body = {"games": 0, "updated_at": None, "job": latest.to_dict() if latest is not None else None}
+        try:
+            population = aggregates.store.get()
+            body.update({"games": population.counts["games"], "updated_at": population.updated_at})
+        except aggregates.AggregatesUnavailable:
+            pass
+        resp.body = json.dumps(body)
+
+    def on_post(self, req, resp):
+        logger.info("POST /average/update")
+        try:
+            job = self.runner.start(self.name, aggregates.store.update)
+        except jobs.JobConflict as e:
+            raise falcon.HTTPConflict(description=str(e))
+        resp.status = falcon.HTTP_202
+        resp.body = json.dumps({"job": job.id, "status": f"/jobs/{job.id}"})
+
+
+class AverageConstants:
+    def on_get(self, req, resp):
+        """ MU/VAR of the distributions in `enums`, regenerated from the population aggregates. """
+        logger.info("GET /average/constants")
+        population = aggregates.store.get()
+        resp.body = json.dumps({"games": population.counts["games"], "constants": population.constants()})
@@ -1,23 +1,28 @@
 import json
 
 import analysis
+import champions
 import database
 import numpy as np
+import sessions
+import summoners
 import util
 
 logger = util.Logger(__name__)
 
+PHASES = ("overall", "early", "mid", "late")
+
 
 class WinRate:
     def on_get(self, req, resp):
         logger.info('GET /winrate')
         params = req.params
-        conn = database.get_connection()
+        conn = req.context.conn
 
-        summoner1 = database.select_summoner(conn=conn,
-                                             summoner_name=params['summoner1'])
-        summoner2 = database.select_summoner(conn=conn,
-                                             summoner_name=params["summoner2"])
+        summoner1 = summoners.resolve(conn=conn,
+                                      summoner_name=params['summoner1'])
+        summoner2 = summoners.resolve(conn=conn,
+                                      summoner_name=params["summoner2"])
         common_games = database.select_common_games(conn=conn, s1=summoner1, s2=summoner2)
 
         wr = analysis.base_analysis.win_rate(common_games)
@@ -31,29 +36,30 @@ class KDA:
     def on_get(self, req, resp):
         logger.info('GET /kda')
         params = req.params
-        conn = database.get_connection()
+        conn = req.context.conn
 
-        summoner1 = database.select_summoner(conn=conn,
-                                             summoner_name=params['summoner1'])
-        summoner2 = database.select_summoner(conn=conn,
-                                             summoner_name=params['summoner2'])
-        common_games = database.select_common_games(conn=conn, s1=summoner1, s2=summoner2)
+        summoner1 = summoners.resolve(conn=conn,
+                                      summoner_name=params['summoner1'])
+        summoner2 = summoners.resolve(conn=conn,
+                                      summoner_name=params['summoner2'])
+        session = sessions.load(conn=conn, s1=summoner1, s2=summoner2)
+        common_games = session.games
 
         kdas = {
             summoner1.name: {"kda": 0, "kills": 0, "deaths": 0, "assists": 0},
             summoner2.name: {"kda": 0, "kills": 0, "deaths": 0, "assists": 0},
         }
         for game in common_games:
-            p1_stats = database.select_stats(conn=conn, statid=game["s1_statid"])
-            p2_stats = database.select_stats(conn=conn, statid=game["s2_statid"])
+            p1_stats = common_games.stats(game["s1_statid"])
+            p2_stats = common_games.stats(game["s2_statid"])
 
-            kdas[summoner1.name]["kills"] += p1_stats.kills
-            kdas[summoner1.name]["deaths"] += p1_stats.deaths
-            kdas[summoner1.name]["assists"] += p1_stats.assists
+            kdas[summoner1.name]["kills"] += p1_stats["kills"]
+            kdas[summoner1.name]["deaths"] += p1_stats["deaths"]
+            kdas[summoner1.name]["assists"] += p1_stats["assists"]
 
-            kdas[summoner2.name]["kills"] += p2_stats.kills
-            kdas[summoner2.name]["deaths"] += p2_stats.deaths
-            kdas[summoner2.name]["assists"] += p2_stats.assists
+            kdas[summoner2.name]["kills"] += p2_stats["kills"]
+            kdas[summoner2.name]["deaths"] += p2_stats["deaths"]
+            kdas[summoner2.name]["assists"] += p2_stats["assists"]
 
         kdas[summoner1.name]["kda"] = analysis.base_analysis.avg_kda(
             kills=kdas[summoner1.name]["kills"],
@@ -73,10 +79,10 @@ class CreepScore:
     def on_get(self, req, resp):
         logger.info('GET /cs')
         params = req.params
-        conn = database.get_connection()
+        conn = req.context.conn
 
-        summoner1 = database.select_summoner(conn=conn, summoner_name=params['summoner1'])
-        summoner2 = database.select_summoner(conn=conn, summoner_name=params['summoner2'])
+        summoner1 = summoners.resolve(conn=conn, summoner_name=params['summoner1'])
+        summoner2 = summoners.resolve(conn=conn, summoner_name=params['summoner2'])
         common_game_stats = database.select_common_game_stats(conn=conn, s1=summoner1, s2=summoner2)
 
         cs = {summoner1.name: 0, summoner2.name: 0}
@@ -100,10 +106,10 @@ class AverageRole:
     def on_get(self, req, resp):
         logger.info('GET /average_role')
         params = req.params
-        conn = database.get_connection()
+        conn = req.context.conn
 
-        summoner1 = database.select_summoner(conn=conn, summoner_name=params['summoner1'])
-        summoner2 = database.select_summoner(conn=conn, summoner_name=params['summoner2'])
+        summoner1 = summoners.resolve(conn=conn, summoner_name=params['summoner1'])
+        summoner2 = summoners.resolve(conn=conn, summoner_name=params['summoner2'])
         common_game = database.select_common_games(conn=conn, s1=summoner1, s2=summoner2)
 
         p1_role = analysis.base_analysis.determine_avg_role(games=common_game, role_key="s1_role", lane_key="s1_lane")
@@ -119,61 +125,22 @@ class GoldDifference:
     def on_get(self, req, resp):
         logger.info('GET /gold-diffference')
         params = req.params
-        conn = database.get_connection()
+        conn = req.context.conn
 
-        summoner1 = database.select_summoner(conn=conn, summoner_name=params['summoner1'])
-        summoner2 = database.select_summoner(conn=conn, summoner_name=params['summoner2'])
-        common_game = database.select_common_games(conn=conn, s1=summoner1, s2=summoner2)
+        summoner1 = summoners.resolve(conn=conn, summoner_name=params['summoner1'])
+        summoner2 = summoners.resolve(conn=conn, summoner_name=params['summoner2'])
+        session = sessions.load(conn=conn, s1=summoner1, s2=summoner2)
+        features = session.features()
+
+        # per-game gold differences of all games in which both summoners have a lane opponent
+        lane_games = session.games.lane_games()
+        p1 = [game["s1_participantid"] for game in lane_games]
+        p2 = [game["s2_participantid"] for game in lane_games]
 
         gold_diff = {
-            summoner1.name: {"overall": [], "early": [], "mid": [], "late": []},
-            summoner2.name: {"overall": [], "early": [], "mid": [], "late": []}
+            summoner1.name: {phase: np.nanmean(features.values(f"gold_diff.{phase}", p1)) for phase in PHASES},
+            summoner2.name: {phase: np.nanmean(features.values(f"gold_diff.{phase}", p2)) for phase in PHASES},
         }
-        for game in common_game:
-            p1_frames = database.select_participant_frames(conn=conn, participant_id=game["s1_participantid"])
-            p1_opponent = database.select_opponent(
-                conn=conn,
-                participant_id=game["s1_participantid"],
-                game_id=game["gameid"],
-                position=(game["s1_lane"], game["s1_role"])
-            )
-            if p1_opponent is None:
-                continue
-            p1_opponent_frames = database.select_participant_frames(conn=conn, participant_id=p1_opponent.participant_id)
-
-            p2_frames = database.select_participant_frames(conn=conn, participant_id=game["s2_participantid"])
-            p2_opponent = database.select_opponent(
-                conn=conn,
-                participant_id=game["s2_participantid"],
-                game_id=game["gameid"],
-                position=(game["s2_lane"], game["s2_role"])
-            )
-            if p2_opponent is None:
-                continue
-            p2_opponent_frames = database.select_participant_frames(conn=conn, participant_id=p2_opponent.participant_id)
-
-            p1_gold_diff = analysis.base_analysis.gold_diff(frames=p1_frames, opponent_frames=p1_opponent_frames)
-            p2_gold_diff = analysis.base_analysis.gold_diff(frames=p2_frames, opponent_frames=p2_opponent_frames)
-
-            gold_diff[summoner1.name]["overall"].append(p1_gold_diff["overall"])
-            gold_diff[summoner1.name]["early"].append(p1_gold_diff["early"])
-            gold_diff[summoner1.name]["mid"].append(p1_gold_diff["mid"])
-            gold_diff[summoner1.name]["late"].append(p1_gold_diff["late"])
-
-            gold_diff[summoner2.name]["overall"].append(p2_gold_diff["overall"])
-            gold_diff[summoner2.name]["early"].append(p2_gold_diff["early"])
-            gold_diff[summoner2.name]["mid"].append(p2_gold_diff["mid"])
-            gold_diff[summoner2.name]["late"].append(p2_gold_diff["late"])
-
-        gold_diff[summoner1.name]["overall"] = np.nanmean(np.array(gold_diff[summoner1.name]["overall"]))
-        gold_diff[summoner1.name]["early"] = np.nanmean(np.array(gold_diff[summoner1.name]["early"]))
-        gold_diff[summoner1.name]["mid"] = np.nanmean(np.array(gold_diff[summoner1.name]["mid"]))
-        gold_diff[summoner1.name]["late"] = np.nanmean(np.array(gold_diff[summoner1.name]["late"]))
-
-        gold_diff[summoner2.name]["overall"] = np.nanmean(np.array(gold_diff[summoner2.name]["overall"]))
-        gold_diff[summoner2.name]["early"] = np.nanmean(np.array(gold_diff[summoner2.name]["early"]))
-        gold_diff[summoner2.name]["mid"] = np.nanmean(np.array(gold_diff[summoner2.name]["mid"]))
-        gold_diff[summoner2.name]["late"] = np.nanmean(np.array(gold_diff[summoner2.name]["late"]))
 
         resp.body = json.dumps(gold_diff)
 
@@ -182,7 +149,7 @@ class AverageGame:
     def on_get(self, req, resp):
         logger.info('GET /avg-game')
         params = req.params
-        conn = database.get_connection()
+        conn = req.context.conn
 
         average_game = {
             'summoners': [
@@ -212,22 +179,24 @@ class AverageGame:
             }
         }
 
-        summoner1 = database.select_summoner(
+        summoner1 = summoners.resolve(
             conn=conn,
             summoner_name=params['summoner1'],
         )
-        summoner2 = database.select_summoner(
+        summoner2 = summoners.resolve(
             conn=conn,
             summoner_name=params['summoner2'],
         )
-        common_games = database.select_common_games(
+        session = sessions.load(
             conn=conn,
             s1=summoner1,
             s2=summoner2,
         )
+        common_games = session.games
 
         common_stats = analysis.base_analysis.common_stats(
             common_games=common_games,
+            conn=conn,
         )
         average_game['common']['drakes'] = common_stats['drakes']
         average_game['common']['nash'] = common_stats['nash']
@@ -238,10 +207,10 @@ class AverageGame:
         average_game['common']['first_baron'] = common_stats['first_baron']
         average_game['common']['first_dragon'] = common_stats['first_dragon']
         average_game['common']['first_herald'] = common_stats['first_herald']
-        average_game['common']['bans'] = database.select_champion_name_id(
+        average_game['common']['bans'] = champions.catalogue.name(
+            common_stats['bans'],
             conn=conn,
-            champ_id=common_stats['bans'],
-        )[1]
+        )
 
         # roles
         average_game['summoners'][0]['role'] = analysis.base_analysis.determine_avg_role(
@@ -261,16 +230,16 @@ class AverageGame:
             summoner2.name: {"kda": 0, "kills": 0, "deaths": 0, "assists": 0},
         }
         for game in common_games:
-            p1_stats = database.select_stats(conn=conn, statid=game["s1_statid"])
-            p2_stats = database.select_stats(conn=conn, statid=game["s2_statid"])
+            p1_stats = common_games.stats(game["s1_statid"])
+            p2_stats = common_games.stats(game["s2_statid"])
 
-            kdas[summoner1.name]["kills"] += p1_stats.kills
-            kdas[summoner1.name]["deaths"] += p1_stats.deaths
-            kdas[summoner1.name]["assists"] += p1_stats.assists
+            kdas[summoner1.name]["kills"] += p1_stats["kills"]
+            kdas[summoner1.name]["deaths"] += p1_stats["deaths"]
+            kdas[summoner1.name]["assists"] += p1_stats["assists"]
 
-            kdas[summoner2.name]["kills"] += p2_stats.kills
-            kdas[summoner2.name]["deaths"] += p2_stats.deaths
-            kdas[summoner2.name]["assists"] += p2_stats.assists
+            kdas[summoner2.name]["kills"] += p2_stats["kills"]
+            kdas[summoner2.name]["deaths"] += p2_stats["deaths"]
+            kdas[summoner2.name]["assists"] += p2_stats["assists"]
 
         average_game['summoners'][0]['kda'] = analysis.base_analysis.avg_kda(
             kills=kdas[summoner1.name]["kills"],
@@ -306,12 +275,12 @@ class CommonGames:
     def on_get(self, req, resp):
         logger.info('GET /common-games')
         params = req.params
-        conn = database.get_connection()
-        summoner1 = database.select_summoner(
+        conn = req.context.conn
+        summoner1 = summoners.resolve(
             conn=conn,
             summoner_name=params['summoner1'],
         )
-        summoner2 = database.select_summoner(
+        summoner2 = summoners.resolve(
             conn=conn,
             summoner_name=params['summoner2'],
         )
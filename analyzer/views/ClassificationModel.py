@@ -1,185 +1,155 @@
+import abc
 import json
-import pickle
 
+import falcon
 import numpy as np
-import scipy.stats as ss
-from sklearn.cluster import KMeans
 
 import analysis
-import database
-import enums
+import features
+import jobs
+import models
 import util
 
 logger = util.Logger(__name__)
 
 
-class MillionaireModel:
-    def on_get(self, req, resp):
-        """Calculates classification model for Millionaire class."""
-        logger.info("GET /average/aggression")
-        conn = database.get_connection()
-        games = database.select_all_games(conn=conn)
-
-        values = []
-
-        for game in games:
-            stats = database.select_stats(conn=conn, statid=game["s1_statid"])
-            team_gold = database.select_team_gold(conn=conn, team_id=game["s1_teamid"], game_id=game["gameid"])
-
-            gold_earned = analysis.base_analysis.gold_share(stats.gold_earned, team_gold=team_gold[0]["gold"])
-
-            p1_frames = database.select_participant_frames(conn=conn, participant_id=game["s1_participantid"])
-            p1_opponent = database.select_opponent(
-                conn=conn,
-                participant_id=game["s1_participantid"],
-                game_id=game["gameid"],
-                position=(game["s1_lane"], game["s1_role"])
-            )
-            if p1_opponent is not None:
-                p1_opponent_frames = database.select_participant_frames(conn=conn,
-                                                                        participant_id=p1_opponent.participant_id)
-                if len(p1_opponent_frames) > 0:
-                    p1_gold_diff = analysis.base_analysis.gold_diff(frames=p1_frames,
-                                                                    opponent_frames=p1_opponent_frames)
-
-                    earned = ss.norm.cdf(gold_earned, enums.GoldShare.MU, enums.GoldShare.SIG)
-                    diff = ss.norm.cdf(p1_gold_diff["overall"], enums.GoldDiffAll.MU, enums.GoldDiffAll.SIG)
-                    if earned == 0 or diff == 0 or np.isnan(earned) or np.isnan(diff):
-                        continue
-                    values.append([earned, diff])
-
-        arr = np.reshape(np.array(values)[np.logical_not(np.isnan(values))], (-1, 2))
-        means = KMeans(n_clusters=2, random_state=0)
-        cluster_arr = means.fit(arr)
-        # fit needs to be done, so we can use this model later on in other analysis steps
-        pickle.dump(means, open('/analyzer/kmeans_millionaire.pkl', 'wb'))
-
-        centres = means.cluster_centers_.tolist()
-        resp.body = json.dumps({
-            "0": centres[0],
-            "1": centres[1]
-        })
-
-
-class MurderousDuoModel:
+class ModelJob(abc.ABC):
+    """
+    Retrains a model in a background job on POST and reports the current model and its latest job on GET.
+
+    Subclasses set the model `name` and route `path` and implement `train(conn, job)`, which reports its progress
+    through `job.update` and returns the version and cluster centres of the model it published.
+    """
+
+    name = None
+    path = None
+
+    def __init__(self, runner: jobs.JobRunner):
+        self.runner = runner
+
+    @abc.abstractmethod
+    def train(self, conn, job):
+        pass
+
     def on_get(self, req, resp):
+        logger.info(f"GET {self.path}")
+        latest = self.runner.latest(self.name)
+        body = {"model_version": None, "job": latest.to_dict() if latest is not None else None}
+        try:
+            loaded = models.registry.get(self.name)
+        except models.ModelUnavailable:
+            loaded = None
+        if loaded is not None:
+            centres = loaded.model.cluster_centers_.tolist()
+            body.update({"model_version": loaded.version, "0": centres[0], "1": centres[1]})
+        resp.body = json.dumps(body)
+
+    def on_post(self, req, resp):
+        logger.info(f"POST {self.path}")
+        try:
+            job = self.runner.start(self.name, self.train)
+        except jobs.JobConflict as e:
+            raise falcon.HTTPConflict(description=str(e))
+        resp.status = falcon.HTTP_202
+        resp.body = json.dumps({"job": job.id, "status": f"/jobs/{job.id}"})
+
+
+class Job:
+    def __init__(self, runner: jobs.JobRunner):
+        self.runner = runner
+
+    def on_get(self, req, resp, job_id):
+        logger.info(f"GET /jobs/{job_id}")
+        job = self.runner.get(job_id)
+        if job is None:
+            raise falcon.HTTPNotFound(description=f'unknown job {job_id}')
+        resp.body = json.dumps(job.to_dict())
+
+
+class MillionaireModel(ModelJob):
+    name = 'millionaire'
+    path = '/model/millionaire'
+
+    def train(self, conn, job):
         """Calculates classification model for Millionaire class."""
-        logger.info("GET /average/aggression")
-        conn = database.get_connection()
-        games = database.select_all_games(conn=conn)
-
-        values = []
-        for game in games:
-            stats = database.select_stats(conn=conn, statid=game["s1_statid"])
-            team_kills = database.select_kill_timeline(conn=conn, game_id=game["gameid"], team_id=game["s1_teamid"])
-
-            kp = analysis.base_analysis.ss_kill_participation(game["s1_participantid"], team_kills)
-            kda = analysis.base_analysis.game_kda({
-                "kills": stats.kills, "deaths": stats.deaths, "assists": stats.assists
-            })
-
-            if not np.isnan(kp) and not np.isnan(kda):
-                kp = ss.norm.cdf(kp, enums.KP.MU, enums.KP.SIG)
-                kda = ss.expon.cdf(kda, scale=enums.KDA.MU)
-                if kp == 0 or kda == 0 or np.isnan(kp) or np.isnan(kda):
-                    continue
-                values.append([kp, kda])
-        means = KMeans(n_clusters=2, random_state=0)
-
-        cluster_arr = means.fit(np.array(values))
-        # fit needs to be done, so we can use this model later on in other analysis steps
-        pickle.dump(means, open('/analyzer/kmeans_murderous.pkl', 'wb'))
-
-        centres = means.cluster_centers_.tolist()
-        resp.body = json.dumps({
-            "0": centres[0],
-            "1": centres[1]
-        })
-
-
-class FarmerType:
-    def on_get(self, req, resp):
+        earned, diff = _population_features(conn, job, "gold_share", "gold_diff.overall")
+        earned = analysis.normalization.GOLD_SHARE.cdf(earned)
+        diff = analysis.normalization.GOLD_DIFF.cdf(diff)
+        valid = (earned != 0) & (diff != 0) & ~np.isnan(earned) & ~np.isnan(diff)
+        return _fit(self.name, job, np.column_stack((earned[valid], diff[valid])))
+
+
+class MurderousDuoModel(ModelJob):
+    name = 'murderous'
+    path = '/model/murderous-duo'
+
+    def train(self, conn, job):
+        """Calculates classification model for Murderous Duo class."""
+        kp, kda = _population_features(conn, job, "kp", "kda")
+        kp = analysis.normalization.KP.cdf(kp)
+        kda = analysis.normalization.KDA.cdf(kda)
+        valid = (kp != 0) & (kda != 0) & ~np.isnan(kp) & ~np.isnan(kda)
+        return _fit(self.name, job, np.column_stack((kp[valid], kda[valid])))
+
+
+class FarmerType(ModelJob):
+    name = 'farmers'
+    path = '/model/farmer-type'
+
+    def train(self, conn, job):
         """Calculates classification model for Farmer class."""
-        logger.info("GET /model/farmer-type")
-        conn = database.get_connection()
-        games = database.select_all_games(conn=conn)
-
-        values = []
-        for game in games:
-            stats = database.select_stats(conn=conn, statid=game["s1_statid"])
-            team_cs = database.select_team_cs(conn=conn, team_id=game["s1_teamid"], game_id=game["gameid"])
-
-            e_jgl = stats.neutral_minions_killed_enemy_jungle if stats.neutral_minions_killed_enemy_jungle is not None else 0
-            t_jgl = stats.neutral_minions_killed_team_jungle if stats.neutral_minions_killed_team_jungle is not None else 0
-
-            if team_cs[0]["cs"] is None:
-                continue
-            cs = stats.total_minions_killed + e_jgl + t_jgl
-            cs_share = analysis.base_analysis.cs_share(cs, team_cs[0]["cs"])
-
-            p1_frames = database.select_participant_frames(conn=conn, participant_id=game["s1_participantid"])
-            p1_opponent = database.select_opponent(
-                conn=conn,
-                participant_id=game["s1_participantid"],
-                game_id=game["gameid"],
-                position=(game["s1_lane"], game["s1_role"])
-            )
-            if p1_opponent is not None:
-                p1_opponent_frames = database.select_participant_frames(conn=conn,
-                                                                        participant_id=p1_opponent.participant_id)
-                if len(p1_opponent_frames) > 0:
-                    p1_cs_diff = analysis.base_analysis.cs_diff(frames=p1_frames,
-                                                                opponent_frames=p1_opponent_frames)
-
-                    share = ss.norm.cdf(cs_share, enums.CreepShare.MU, enums.CreepShare.SIG)
-                    diff = ss.norm.cdf(p1_cs_diff["overall"], enums.CSD.MU, enums.CSD.SIG)
-                    if share == 0 or diff == 0 or np.isnan(share) or np.isnan(diff):
-                        continue
-                    values.append([share, diff])
-
-        means = KMeans(n_clusters=2, random_state=0)
-        cluster_arr = means.fit(np.array(values))
-        # fit needs to be done, so we can use this model later on in other analysis steps
-        pickle.dump(means, open('/analyzer/kmeans_farmers.pkl', 'wb'))
-
-        centres = means.cluster_centers_.tolist()
-        resp.body = json.dumps({
-            "0": centres[0],
-            "1": centres[1]
-        })
-
-
-class TacticianModel:
-    def on_get(self, req, resp):
-        logger.info("GET /average/aggression")
-        conn = database.get_connection()
-        games = database.select_all_games(conn=conn)
-
-        values = []
-        for game in games:
-            frames = database.select_game_frames(conn=conn, game_id=game["gameid"])
-            kills = database.select_all_kill_timeline(conn=conn, game_id=game["gameid"])
-            objectives = database.select_objectives(conn=conn, game_id=game["gameid"])
-
-            t = analysis.classification.tactician(game["s1_participantid"], game["s1_teamid"], kills, objectives,
-                                                  frames, conn)
-            if np.isnan(t["worthness"]):
-                continue
-            if np.isnan(t["objectives"]):
-                continue
-            worthness = ss.norm.cdf(t["worthness"], enums.Worthness.MU, enums.Worthness.SIG)
-            objectives = ss.expon.cdf(t["objectives"], scale=enums.KillObjectives.MU)
-            if worthness == 0 or np.isnan(worthness) or objectives == 0 or np.isnan(objectives):
-                continue
-            values.append([worthness, objectives])
-
-        means = KMeans(n_clusters=2, random_state=0)
-        cluster_arr = means.fit(np.array(values))
-        # fit needs to be done, so we can use this model later on in other analysis steps
-        pickle.dump(means, open('/analyzer/kmeans_tactician.pkl', 'wb'))
-
-        centres = means.cluster_centers_.tolist()
-        resp.body = json.dumps({
-            "0": centres[0],
-            "1": centres[1]
-        })
+        share, diff = _population_features(conn, job, "cs_share", "cs_diff.overall")
+        share = analysis.normalization.CREEP_SHARE.cdf(share)
+        diff = analysis.normalization.CSD.cdf(diff)
+        valid = (share != 0) & (diff != 0) & ~np.isnan(share) & ~np.isnan(diff)
+        return _fit(self.name, job, np.column_stack((share[valid], diff[valid])))
+
+
+class TacticianModel(ModelJob):
+    name = 'tactician'
+    path = '/model/tactician'
+
+    def train(self, conn, job):
+        """Calculates classification model for Tactician class."""
+        worthness, objectives = _population_features(conn, job, "worthness", "objectives")
+        worthness = analysis.normalization.WORTHNESS.cdf(worthness)
+        objectives = analysis.normalization.KILL_OBJECTIVES.cdf(objectives)
+        valid = (worthness != 0) & (objectives != 0) & ~np.isnan(worthness) & ~np.isnan(objectives)
+        return _fit(self.name, job, np.column_stack((worthness[valid], objectives[valid])))
+
+
+def _population_features(conn, job, *names):
+    """
+    Features of all game rows, computing and storing the features of new games first.
+
+    The stored chunks are streamed one at a time, only the feature values themselves are collected for the fit.
+    """
+    features.store.update(conn, job)
+    values = {name: [np.empty(0)] for name in names}
+    for _, table in features.store.chunks():
+        # game rows are the participants of games with a team row
+        rows = ~np.isnan(table.columns["win"])
+        for name in names:
+            values[name].append(table.columns[name][rows])
+    return [np.concatenate(values[name]) for name in names]
+
+
+def _fit(name, job, values):
+    job.update(samples=len(values))
+    means = _kmeans()
+    # fit needs to be done, so we can use this model later on in other analysis steps
+    means.fit(values)
+    loaded = models.registry.publish(name, models.CentroidModel.from_kmeans(means))
+
+    centres = means.cluster_centers_.tolist()
+    return {
+        "model_version": loaded.version,
+        "0": centres[0],
+        "1": centres[1]
+    }
+
+
+def _kmeans():
+    # scikit-learn is only needed to retrain, so it is not imported with the serving endpoints
+    from sklearn.cluster import KMeans
+    return KMeans(n_clusters=2, random_state=0)
@@ -1,7 +1,7 @@
 import json
 
 import analysis
-import database
+import summoners
 import util
 
 logger = util.Logger(__name__)
@@ -11,9 +11,9 @@ class ChampionCombinations:
     def on_get(self, req, resp):
         logger.info('GET /combinations/champions')
         params = req.params
-        conn = database.get_connection()
+        conn = req.context.conn
 
-        s1 = database.select_summoner(conn, summoner_name=params["summoner1"])
-        s2 = database.select_summoner(conn, summoner_name=params["summoner2"])
+        s1 = summoners.resolve(conn=conn, summoner_name=params["summoner1"])
+        s2 = summoners.resolve(conn=conn, summoner_name=params["summoner2"])
         comb = analysis.combinations.team_champions(s1, s2, conn)
         resp.body = json.dumps(comb)
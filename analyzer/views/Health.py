@@ -0,0 +1,41 @@
+import json
+
+import util
+
+logger = util.Logger(__name__)
+
+
+class PoolStats:
+    def __init__(self, pool):
+        self.pool = pool
+
+    def on_get(self, req, resp):
+        logger.info('GET /health/pool')
+        resp.body = json.dumps(self.pool.stats())
+
+
+class ModelVersions:
+    def __init__(self, registry):
+        self.registry = registry
+
+    def on_get(self, req, resp):
+        logger.info('GET /health/models')
+        resp.body = json.dumps(self.registry.versions())
+
+
+class FeatureStats:
+    def __init__(self, store):
+        self.store = store
+
+    def on_get(self, req, resp):
+        logger.info('GET /health/features')
+        resp.body = json.dumps(self.store.stats())
+
+
+class CacheStats:
+    def __init__(self, caches: dict):
+        self.caches = caches
+
+    def on_get(self, req, resp):
+        logger.info('GET /health/cache')
+        resp.body = json.dumps({name: cache.stats() for name, cache in self.caches.items()})
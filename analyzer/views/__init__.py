@@ -1 +1 @@
-from views import BaseMetrics, CombinationMetrics, AggressionMetrics, Averages, Classification, ClassificationModel
+from views import BaseMetrics, CombinationMetrics, AggressionMetrics, Averages, Classification, ClassificationModel, Health
@@ -0,0 +1,6 @@
+""" Put the analyzer and the common checkout on the path, like the PYTHONPATH of the image. """
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [os.path.join(ROOT, 'analyzer'), os.path.join(ROOT, 'common', 'common'), ROOT]
@@ -0,0 +1,70 @@
+""" Running statistics merged in any order against the statistics of all values at once. """
+import numpy as np
+import pytest
+
+from aggregates import RunningStats
+
+
+@pytest.fixture
+def batches():
+    rng = np.random.default_rng(21)
+    batches = [rng.normal(loc, scale, size) for loc, scale, size in [(0.4, 0.1, 50), (3.0, 2.0, 7), (-1.0, 0.5, 1),
+                                                                      (1e4, 1.0, 200), (0.0, 0.0, 0), (2.5, 3.0, 31)]]
+    batches[1][[2, 5]] = np.nan
+    return batches
+
+
+def _stats(batch):
+    stats = RunningStats()
+    stats.add(batch)
+    return stats
+
+
+def _assert_matches(stats, batches):
+    values = np.concatenate(batches)
+    assert stats.count == np.count_nonzero(~np.isnan(values))
+    np.testing.assert_allclose(stats.average(), np.nanmean(values), rtol=1e-12)
+    np.testing.assert_allclose(stats.variance, np.nanvar(values), rtol=1e-9)
+
+
+def test_add_in_any_order(batches):
+    for order in (batches, batches[::-1], batches[2:] + batches[:2]):
+        stats = RunningStats()
+        for batch in order:
+            stats.add(batch)
+        _assert_matches(stats, batches)
+
+
+def test_merge_in_any_order(batches):
+    # left fold, right fold and a balanced tree of merges give the same statistics
+    left = RunningStats()
+    for batch in batches:
+        left.merge(_stats(batch))
+    _assert_matches(left, batches)
+
+    right = RunningStats()
+    for batch in batches[::-1]:
+        merged = _stats(batch)
+        merged.merge(right)
+        right = merged
+    _assert_matches(right, batches)
+
+    level = [_stats(batch) for batch in batches]
+    while len(level) > 1:
+        pairs = [level[idx:idx + 2] for idx in range(0, len(level), 2)]
+        level = []
+        for pair in pairs:
+            for other in pair[1:]:
+                pair[0].merge(other)
+            level.append(pair[0])
+    _assert_matches(level[0], batches)
+
+
+def test_round_trip_and_empty():
+    stats = RunningStats.from_dict(_stats([1.0, 2.0, 4.0]).to_dict())
+    stats.merge(RunningStats())
+    _assert_matches(stats, [np.array([1.0, 2.0, 4.0])])
+
+    empty = RunningStats()
+    empty.add([np.nan])
+    assert empty.count == 0 and np.isnan(empty.average()) and np.isnan(empty.variance)
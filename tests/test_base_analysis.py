@@ -0,0 +1,78 @@
+""" The batched gold and creep score differences against the per-game loops they replaced. """
+import numpy as np
+import pytest
+
+from analysis import base_analysis
+from analysis.frames import GameFrames
+from enums import GameState
+
+PHASES = ("overall", "early", "mid", "late")
+
+
+def _baseline_diff(frames, opponent_frames, value):
+    """ Per-game loop of the former gold_diff/cs_diff over frame rows. """
+    diff = {phase: [] for phase in PHASES}
+    for idx, frame in enumerate(frames):
+        d = value(frame) - value(opponent_frames[idx])
+        if idx <= GameState.EARLY[1]:
+            diff["early"].append(d)
+        elif GameState.MID[0] <= idx <= GameState.MID[1]:
+            diff["mid"].append(d)
+        elif GameState.LATE[0] <= idx <= GameState.LATE[1]:
+            diff["late"].append(d)
+        diff["overall"].append(d)
+    return {phase: np.average(np.array(values)) if values else np.nan for phase, values in diff.items()}
+
+
+def _frames(participant, minutes, seed):
+    rng = np.random.default_rng(seed)
+    return [{
+        "participantid": participant,
+        "timestamp": minute * 60000 + int(rng.integers(0, 500)),
+        "position": (float(rng.integers(0, 14870)), float(rng.integers(0, 14980))),
+        "totalgold": int(500 + 400 * minute + rng.integers(0, 300)),
+        "minionskilled": int(7 * minute + rng.integers(0, 5)),
+        "jungleminionskilled": int(rng.integers(0, 3) * minute),
+    } for minute in range(minutes)]
+
+
+# (player minutes, opponent minutes): games ending in every phase, and opponents with frames beyond the player's
+GAMES = [(8, 8), (15, 15), (34, 34), (22, 25), (45, 45)]
+
+
+@pytest.fixture
+def lanes():
+    lanes = []
+    for game, (player_minutes, opponent_minutes) in enumerate(GAMES):
+        player_rows = _frames(1, player_minutes, seed=2 * game)
+        opponent_rows = _frames(6, opponent_minutes, seed=2 * game + 1)
+        # rows arrive in any order, GameFrames sorts them by timestamp
+        rows = (player_rows + opponent_rows)[::-1]
+        lanes.append((GameFrames.from_rows(rows), 1, 6, player_rows, opponent_rows))
+    return lanes
+
+
+@pytest.mark.parametrize("batched, value", [
+    (base_analysis.gold_diffs, lambda frame: frame["totalgold"]),
+    (base_analysis.cs_diffs, lambda frame: frame["minionskilled"] + frame["jungleminionskilled"]),
+])
+def test_diffs_match_per_game_loop(lanes, batched, value):
+    diffs = batched([(frames, participant, opponent) for frames, participant, opponent, _, _ in lanes])
+    for game, (_, _, _, player_rows, opponent_rows) in enumerate(lanes):
+        expected = _baseline_diff(player_rows, opponent_rows, value)
+        for phase in PHASES:
+            np.testing.assert_allclose(diffs[phase][game], expected[phase], equal_nan=True)
+
+
+def test_per_game_wrappers_match_batched(lanes):
+    batched = base_analysis.gold_diffs([(frames, player, opponent) for frames, player, opponent, _, _ in lanes])
+    for game, (frames, participant, opponent, _, _) in enumerate(lanes):
+        single = base_analysis.gold_diff(frames, participant, opponent)
+        for phase in PHASES:
+            np.testing.assert_allclose(single[phase], batched[phase][game], equal_nan=True)
+
+
+def test_missing_participant_has_no_diff(lanes):
+    frames = lanes[0][0]
+    diff = base_analysis.cs_diff(frames, 1, 99)
+    assert all(np.isnan(diff[phase]) for phase in PHASES)
@@ -0,0 +1,152 @@
+""" The fight table of a game against the per-kill loops of the former tactician classification. """
+import numpy as np
+import pytest
+
+from analysis import classification
+from analysis.fights import FightTable, MEMBERS, TEAMS
+from analysis.frames import GameFrames
+from enums import Constants
+
+PARTICIPANTS = range(1, 11)
+TEAM = {participant: 100 if participant <= 5 else 200 for participant in PARTICIPANTS}
+HOTSPOTS = [(3000, 11000), (7400, 7500), (11500, 3500)]
+
+
+def _baseline_follow_kills(idx, kills, kill_time, kill_position):
+    """ Former _follow_kills: the kills after `idx` that continue its fight. """
+    f_kills = []
+    counter = idx + 1
+    while counter < len(kills):
+        position = kills[counter]["position"]
+        i_kill_time = kills[counter]["timestamp"] / 60000
+        time_diff = abs(kill_time - i_kill_time)
+        if time_diff >= 1:
+            break
+        radius = Constants.FIGHT_RADIUS + Constants.FIGHT_RADIUS * time_diff
+        if pow(position[0] - kill_position[0], 2) + pow(position[1] - kill_position[1], 2) >= pow(radius, 2):
+            break
+        f_kills.append(counter)
+        counter += 1
+    return f_kills
+
+
+def _baseline_fights(kills):
+    """ Kill indices of every fight, chained like the former tactician loop but over all kills of the game. """
+    fights = []
+    idx = 0
+    while idx < len(kills):
+        follow = _baseline_follow_kills(idx, kills, kills[idx]["timestamp"] / Constants.TIME, kills[idx]["position"])
+        fights.append([idx] + follow)
+        idx += 1 + len(follow)
+    return fights
+
+
+def _baseline_members(kill, rows):
+    """ Former _count_fight_members, with the frame of every participant at the minute closest to the kill. """
+    members = {team: {field: 0 for field in MEMBERS} for team in TEAMS}
+    kill_time = kill["timestamp"] / Constants.TIME
+    radius = Constants.FIGHT_RADIUS + Constants.FIGHT_RADIUS * abs(round(kill_time) - kill_time)
+    for frame in rows:
+        if frame["timestamp"] // Constants.TIME != round(kill_time):
+            continue
+        key = "blue" if TEAM[frame["participantid"]] == 100 else "red"
+        if frame["participantid"] == kill["killer"] or frame["participantid"] in kill["assistingparticipantids"]:
+            members[key]["overall"] += 1
+            members[key]["alive"] += 1
+        elif frame["participantid"] == kill["victim"]:
+            members[key]["overall"] += 1
+            members[key]["dead"] += 1
+        else:
+            position = frame["position"]
+            circle_dist = pow(position[0] - kill["position"][0], 2) + pow(position[1] - kill["position"][1], 2)
+            if circle_dist < pow(radius, 2):
+                members[key]["overall"] += 1
+                members[key]["alive"] += 1
+    return members
+
+
+def _baseline_objectives(kill, objectives):
+    """ Value of the objectives taken up to two minutes after a kill, scanning all of them. """
+    kill_time = kill["timestamp"] / 60000
+    return sum(classification._frame_value(objective) for objective in objectives
+               if kill_time < objective["timestamp"] / 60000 <= kill_time + 2)
+
+
+@pytest.fixture
+def game():
+    rng = np.random.default_rng(11)
+    minutes = 25
+    rows = []
+    for participant in PARTICIPANTS:
+        for minute in range(minutes):
+            spot = HOTSPOTS[rng.integers(len(HOTSPOTS))]
+            rows.append({
+                "participantid": participant,
+                "timestamp": minute * 60000 + int(rng.integers(0, 300)),
+                "position": (spot[0] + float(rng.normal(0, 1500)), spot[1] + float(rng.normal(0, 1500))),
+                "totalgold": 0,
+                "minionskilled": 0,
+                "jungleminionskilled": 0,
+            })
+
+    kills = []
+    timestamp = 90000
+    for _ in range(40):
+        # bursts of close kills with an occasional pause between them
+        timestamp += int(rng.choice([rng.integers(2000, 20000), rng.integers(60000, 180000)], p=[0.7, 0.3]))
+        if timestamp >= (minutes - 1) * 60000:
+            break
+        killer = int(rng.integers(1, 11))
+        enemies = [p for p in PARTICIPANTS if TEAM[p] != TEAM[killer]]
+        allies = [p for p in PARTICIPANTS if TEAM[p] == TEAM[killer] and p != killer]
+        spot = HOTSPOTS[rng.integers(len(HOTSPOTS))]
+        kills.append({
+            "timestamp": timestamp,
+            "killer": killer,
+            "victim": int(rng.choice(enemies)),
+            "assistingparticipantids": [int(p) for p in rng.choice(allies, size=rng.integers(0, 4), replace=False)],
+            "position": (spot[0] + float(rng.normal(0, 800)), spot[1] + float(rng.normal(0, 800))),
+        })
+
+    objectives = [
+        {"timestamp": 400000, "type": "BUILDING_KILL", "towertype": "OUTER_TURRET"},
+        {"timestamp": 200000, "type": "ELITE_MONSTER_KILL", "monstertype": "DRAGON", "monstersubtype": "FIRE_DRAGON"},
+        {"timestamp": 900000, "type": "ELITE_MONSTER_KILL", "monstertype": "RIFTHERALD", "monstersubtype": None},
+        {"timestamp": 1200000, "type": "BUILDING_KILL", "towertype": "INNER_TURRET"},
+    ]
+    frames = GameFrames.from_rows(rows)
+    return rows, kills, objectives, FightTable.build(kills=kills, objectives=objectives, frames=frames, teams=TEAM)
+
+
+def test_fights_match_kill_chains(game):
+    _, kills, _, table = game
+    fights = _baseline_fights(kills)
+    assert len(fights) > 1 and any(len(fight) > 1 for fight in fights)
+    assert len(table) == len(fights)
+    for fight, members in enumerate(fights):
+        assert table.kills(fight).tolist() == members
+        assert table.start[fight] == kills[members[0]]["timestamp"]
+        assert table.end[fight] == kills[members[-1]]["timestamp"]
+
+
+def test_members_are_per_team_maxima_over_the_kills(game):
+    rows, kills, _, table = game
+    for fight, members in enumerate(_baseline_fights(kills)):
+        per_kill = [_baseline_members(kills[idx], rows) for idx in members]
+        expected = {
+            team: {field: max(kill[team][field] for kill in per_kill) for field in MEMBERS} for team in TEAMS
+        }
+        assert table.fight_members(fight) == expected
+
+
+def test_objectives_and_involvement(game):
+    _, kills, objectives, table = game
+    for fight, members in enumerate(_baseline_fights(kills)):
+        assert table.objectives[fight] == sum(_baseline_objectives(kills[idx], objectives) for idx in members)
+
+    for participant in PARTICIPANTS:
+        expected = sorted({
+            fight for fight, members in enumerate(_baseline_fights(kills)) for idx in members
+            if participant in [kills[idx]["killer"], kills[idx]["victim"], *kills[idx]["assistingparticipantids"]]
+        })
+        assert table.fights(participant).tolist() == expected
@@ -0,0 +1,24 @@
+""" The distributions of the metrics against scipy.stats, down into the tails. """
+import numpy as np
+import scipy.stats
+
+from analysis import normalization
+
+
+def test_normal_cdf_keeps_the_lower_tail():
+    normal = normalization.Normal(0.5, 0.2)
+    values = 0.5 + 0.2 * np.linspace(-20, 8, 561)
+    expected = scipy.stats.norm.cdf(values, 0.5, 0.2)
+
+    assert np.all(normal.cdf(values) > 0)
+    np.testing.assert_allclose(normal.cdf(values), expected, rtol=1e-14)
+    np.testing.assert_allclose([normal.cdf(float(value)) for value in values], expected, rtol=1e-9)
+    assert np.isnan(normal.cdf(np.array([np.nan]))[0]) and np.isnan(normal.cdf(np.nan))
+
+
+def test_exponential_cdf():
+    exponential = normalization.Exponential(2.0)
+    values = np.array([-1.0, 0.0, 1e-12, 0.5, 3.0, 80.0])
+    expected = scipy.stats.expon.cdf(values, scale=2.0)
+    np.testing.assert_allclose(exponential.cdf(values), expected, rtol=1e-14)
+    np.testing.assert_allclose([exponential.cdf(float(value)) for value in values], expected, rtol=1e-14)
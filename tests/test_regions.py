@@ -0,0 +1,62 @@
+""" The region raster against the exact line distances it was built from. """
+import math
+
+import numpy as np
+import pytest
+
+from analysis import regions
+from enums import Constants, Map, Region, Side
+
+# a cell is classified by its centre, so only positions this close to a boundary can differ
+CELL_RADIUS = regions.raster.cell * math.sqrt(2) / 2
+
+
+def _exact(x, y):
+    """ Side, band, region and distance to the closest class boundary of positions, from the line distances. """
+    diagonal = regions.diagonal_distance(x, y)
+    side = np.select([diagonal > Constants.DIST_EPS, diagonal < -Constants.DIST_EPS], [Side.RED, Side.BLUE],
+                     Side.NEUTRAL)
+    band = np.floor(diagonal / Constants.DIST_EPS)
+
+    region = np.where(np.abs(diagonal) <= Constants.DIST_EPS, Region.RIVER, Region.JUNGLE)
+    boundary = np.abs(np.abs(diagonal) - Constants.DIST_EPS)
+    for lane in (Region.MID_LANE, Region.BOT_LANE, Region.TOP_LANE):
+        gradient, b, c, lane_side = regions.LANE_LINES[lane]
+        lane_distance = regions.distance(x, y, gradient=gradient, b=b, c=c)
+        if lane_side == 0:
+            in_lane = np.abs(lane_distance) < regions.LANE_WIDTH
+            boundary = np.minimum(boundary, np.abs(np.abs(lane_distance) - regions.LANE_WIDTH))
+        else:
+            in_lane = lane_distance * -lane_side < regions.LANE_WIDTH
+            boundary = np.minimum(boundary, np.abs(lane_distance * -lane_side - regions.LANE_WIDTH))
+        region = np.where(in_lane, lane, region)
+    return side, band, region, boundary
+
+
+@pytest.fixture
+def positions():
+    rng = np.random.default_rng(13)
+    return rng.uniform(0, Map.WIDTH, 200000), rng.uniform(0, Map.HEIGHT, 200000)
+
+
+def test_regions_differ_only_next_to_a_boundary(positions):
+    x, y = positions
+    _, _, region, boundary = _exact(x, y)
+    differ = regions.raster.regions(x, y) != region
+    assert np.count_nonzero(differ) / len(x) < 0.005
+    assert np.all(boundary[differ] <= CELL_RADIUS)
+
+
+def test_sides_and_bands_differ_only_next_to_a_boundary(positions):
+    x, y = positions
+    side, band, _, _ = _exact(x, y)
+    diagonal = regions.diagonal_distance(x, y)
+
+    differ = regions.raster.sides(x, y) != side
+    assert np.count_nonzero(differ) / len(x) < 0.0025
+    assert np.all(np.abs(np.abs(diagonal[differ]) - Constants.DIST_EPS) <= CELL_RADIUS)
+
+    # bands have a boundary every DIST_EPS, so more of them differ, all within a cell of a multiple of DIST_EPS
+    differ = regions.raster.bands(x, y) != band
+    step = np.abs(diagonal[differ] - Constants.DIST_EPS * np.round(diagonal[differ] / Constants.DIST_EPS))
+    assert np.all(step <= CELL_RADIUS)